@@ -2,7 +2,6 @@
 the CSV containing package license mappings.
 """
 
-import os
 import logging
 
 from absl import flags
@@ -10,54 +9,43 @@ from absl import app
 
 from spack_license_utils import utils
 from spack_license_utils import alpine
+from spack_license_utils import names
 
 FLAGS = flags.FLAGS
 
 flags.DEFINE_string('input_file', None, 'The path to the input CSV file.')
 flags.DEFINE_string('aports_dir', None, 'The path to the aports clone.')
 flags.DEFINE_string('output_file', None, 'The path to the output file.')
+flags.DEFINE_string(
+    'index_cache', None,
+    'The (optional) path to a file to cache parsed aports license info in.')
+flags.DEFINE_float(
+    'name_threshold', None,
+    'Also match packages to aports names that are the same once language '
+    'prefixes, lib prefixes, -dev style suffixes and separators are ignored, '
+    'with 0.95 in the confidence column. Other aports names scoring at least '
+    'this (from 0 to 1) are logged as candidates, but not used.')
 
 flags.mark_flag_as_required('input_file')
 flags.mark_flag_as_required('aports_dir')
 flags.mark_flag_as_required('output_file')
 
 
-def get_repository(package_name):
-  # Check the three repositories (main,community,testing)
-  if os.path.exists(os.path.join(FLAGS.aports_dir, 'main', package_name)):
-    return 'main'
-  elif os.path.exists(
-      os.path.join(FLAGS.aports_dir, 'community', package_name)):
-    return 'community'
-  elif os.path.exists(os.path.join(FLAGS.aports_dir, 'testing', package_name)):
-    return 'testing'
-  return None
-
-
 def main(_):
   package_licenses = utils.load_license_csv(FLAGS.input_file)
 
-  has_license_count = 0
-  no_license_count = 0
-
-  for package_license in package_licenses:
-    # Skip util-linux as the license field in Alpine is three lines long
-    # which would massively complicate parsing.
-    if package_license[0] == 'util-linux':
-      continue
-    # Skip packages that already have license info
-    if package_license[1] != 'UNKNOWN':
-      continue
-    repository = get_repository(package_license[0])
-    if repository:
-      # We found a package that exists
-      pkg_license = alpine.get_license(package_license[0], repository,
-                                       FLAGS.aports_dir)
-      package_license[1] = pkg_license
-      package_license[2] = 'Alpine'
-      has_license_count += 1
-    else:
-      no_license_count += 1
+  license_index = alpine.get_license_index(FLAGS.aports_dir, FLAGS.index_cache)
+
+  package_names = utils.get_unknown_package_names(package_licenses)
+  resolved_names = {}
+  if FLAGS.name_threshold is not None:
+    resolved_names = names.resolve_names(package_names, license_index,
+                                         FLAGS.name_threshold)
+  has_license_count = utils.apply_package_licenses(
+      package_licenses,
+      alpine.get_package_licenses(package_names, license_index, resolved_names),
+      'Alpine', names.get_confidences(resolved_names))
+  no_license_count = len(package_names) - has_license_count
 
   utils.write_license_csv(FLAGS.output_file, package_licenses)
 
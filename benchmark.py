@@ -0,0 +1,284 @@
+"""This script benchmarks the hot paths of the license tools on synthetic
+inputs, and compares the results against a baseline from an earlier run.
+"""
+
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from absl import flags
+from absl import app
+
+from spack_license_utils import utils
+from spack_license_utils import alpine
+from spack_license_utils import cran
+from spack_license_utils import pypi
+from spack_license_utils import names
+from spack_license_utils import spdx
+from spack_license_utils import package_ast
+from spack_license_utils import tagger
+from spack_license_utils import synthetic
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('license_json', 'licenses.json',
+                    'The path to the licenses JSON file.')
+flags.DEFINE_integer('seed', 0, 'The seed the synthetic inputs are made with.')
+flags.DEFINE_integer('aports_packages', 20000,
+                     'The number of APKBUILDs in the synthetic aports tree.')
+flags.DEFINE_integer('spack_packages', 8000,
+                     'The number of packages in the synthetic spack tree.')
+flags.DEFINE_integer('cran_packages', 20000,
+                     'The number of packages in the synthetic CRAN index.')
+flags.DEFINE_integer('repeat', 5, 'The number of times to time each benchmark.')
+flags.DEFINE_list('benchmarks', None,
+                  'The benchmarks to run. Defaults to all of them.')
+flags.DEFINE_string(
+    'work_dir', None,
+    'An (empty) directory to write the synthetic inputs to, so they can be '
+    'inspected. Defaults to a temporary directory that is removed afterwards.')
+flags.DEFINE_string('output_file', None,
+                    'The (optional) path to write the results to as JSON.')
+flags.DEFINE_string(
+    'baseline_file', None,
+    'The (optional) path to the JSON results of an earlier run to compare '
+    'against.')
+flags.DEFINE_float(
+    'regression_threshold', 1.1,
+    'The ratio of median time to the baseline median above which a '
+    'benchmark counts as a regression.')
+
+
+class Fixtures:
+  """The synthetic inputs, generated once and shared by the benchmarks."""
+
+  def __init__(self, work_dir, rng):
+    self.license_map = utils.get_license_list(FLAGS.license_json)
+
+    self.aports_dir = os.path.join(work_dir, 'aports')
+    self.aports_packages = synthetic.write_aports_tree(self.aports_dir, rng,
+                                                       FLAGS.aports_packages)
+
+    self.spack_checkout = os.path.join(work_dir, 'spack')
+    self.packages_csv = synthetic.write_spack_tree(self.spack_checkout, rng,
+                                                   FLAGS.spack_packages)
+    self.packages_dir = os.path.join(self.spack_checkout, 'var', 'spack',
+                                     'repos', 'builtin', 'packages')
+    self.package_licenses = utils.load_license_csv(self.packages_csv)
+    self.package_names = [
+        package_license.name for package_license in self.package_licenses
+    ]
+
+    self.r_licenses_file, self.cran_packages_file = (
+        synthetic.write_cran_licenses(
+            os.path.join(work_dir, 'cran'), rng, FLAGS.cran_packages))
+
+    self.license_expressions = [
+        synthetic.get_alpine_license(rng) for _ in range(FLAGS.aports_packages)
+    ]
+    self.pypi_server = synthetic.PyPIServer(rng, [
+        package_name[3:]
+        for package_name in self.package_names
+        if package_name.startswith('py-')
+    ])
+    self.output_dir = os.path.join(work_dir, 'output')
+    os.makedirs(self.output_dir, exist_ok=True)
+
+
+def benchmark_validate_license(fixtures):
+  # Parsed expressions are cached, which would hide the parser.
+  spdx._parse.cache_clear()
+  for license_expression in fixtures.license_expressions:
+    utils.validate_license(license_expression, fixtures.license_map)
+
+
+def benchmark_alpine_get_license(fixtures):
+  for repository, package in fixtures.aports_packages:
+    alpine.get_license(package, repository, fixtures.aports_dir)
+
+
+def benchmark_alpine_license_map(fixtures):
+  alpine.get_license_map(fixtures.aports_dir)
+
+
+def benchmark_load_license_csv(fixtures):
+  utils.load_license_csv(fixtures.packages_csv)
+
+
+def benchmark_write_license_csv(fixtures):
+  utils.write_license_csv(
+      os.path.join(fixtures.output_dir, 'packages.csv'),
+      fixtures.package_licenses)
+
+
+def benchmark_lint_package_licenses(fixtures):
+  spdx._parse.cache_clear()
+  utils.lint_package_licenses(
+      utils.load_license_csv(fixtures.packages_csv), fixtures.license_map)
+
+
+def benchmark_cran_r_licenses(fixtures):
+  cran.normalize_license.cache_clear()
+  cran.load_r_licenses(fixtures.r_licenses_file)
+
+
+def benchmark_cran_packages_file(fixtures):
+  cran.normalize_license.cache_clear()
+  cran.load_packages_licenses(fixtures.cran_packages_file)
+
+
+def benchmark_pypi_licenses(fixtures):
+  session = pypi.create_session()
+  package_name_index = pypi.get_package_name_index(session,
+                                                   fixtures.pypi_server.url)
+  pypi.get_package_licenses(fixtures.package_names, fixtures.license_map,
+                            package_name_index, 16, fixtures.pypi_server.url)
+
+
+def benchmark_resolve_names(fixtures):
+  names.resolve_names(fixtures.package_names,
+                      [package for _, package in fixtures.aports_packages],
+                      names.DEFAULT_THRESHOLD)
+
+
+def benchmark_package_ast_licenses(fixtures):
+  for package_file in package_ast.get_package_files(
+      fixtures.packages_dir).values():
+    try:
+      package_ast.get_package_file_licenses(package_file)
+    except package_ast.UnresolvedLicenseError:
+      pass
+
+
+def benchmark_tag_add_license(fixtures):
+  for package_name, package_file in package_ast.get_package_files(
+      fixtures.packages_dir).items():
+    with open(package_file) as package_source:
+      tagger.add_license(package_source.read(), 'MIT', package_name)
+
+
+BENCHMARKS = {
+    'validate_license': benchmark_validate_license,
+    'alpine_get_license': benchmark_alpine_get_license,
+    'alpine_license_map': benchmark_alpine_license_map,
+    'load_license_csv': benchmark_load_license_csv,
+    'write_license_csv': benchmark_write_license_csv,
+    'lint_package_licenses': benchmark_lint_package_licenses,
+    'cran_r_licenses': benchmark_cran_r_licenses,
+    'cran_packages_file': benchmark_cran_packages_file,
+    'pypi_licenses': benchmark_pypi_licenses,
+    'resolve_names': benchmark_resolve_names,
+    'package_ast_licenses': benchmark_package_ast_licenses,
+    'tag_add_license': benchmark_tag_add_license,
+}
+
+
+def run_benchmark(benchmark_function, fixtures):
+  """Times a benchmark FLAGS.repeat times, then measures its peak memory.
+
+  Memory is measured in a separate run since tracing allocations slows the
+  code down. Only allocations in this process are seen, not in workers.
+  """
+  times = []
+  for _ in range(FLAGS.repeat):
+    gc.collect()
+    start_time = time.perf_counter()
+    benchmark_function(fixtures)
+    times.append(time.perf_counter() - start_time)
+
+  gc.collect()
+  tracemalloc.start()
+  benchmark_function(fixtures)
+  _, peak_memory = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  return {
+      'times': times,
+      'min': min(times),
+      'median': statistics.median(times),
+      'peak_memory_bytes': peak_memory,
+  }
+
+
+def compare_to_baseline(results, baseline):
+  """Logs how each benchmark changed. Returns the names that regressed."""
+  regressions = []
+  for benchmark_name, result in results['benchmarks'].items():
+    baseline_result = baseline['benchmarks'].get(benchmark_name)
+    if baseline_result is None:
+      continue
+    time_ratio = result['median'] / max(baseline_result['median'], 1e-9)
+    memory_ratio = result['peak_memory_bytes'] / max(
+        baseline_result['peak_memory_bytes'], 1)
+    logging.info(f'{benchmark_name}: {time_ratio:.2f}x time, '
+                 f'{memory_ratio:.2f}x peak memory vs the baseline.')
+    if time_ratio > FLAGS.regression_threshold:
+      regressions.append(benchmark_name)
+  if regressions:
+    logging.warning(f'Regressed against the baseline: {", ".join(regressions)}')
+  return regressions
+
+
+def run_benchmarks(work_dir):
+  benchmark_names = FLAGS.benchmarks or list(BENCHMARKS)
+  for benchmark_name in benchmark_names:
+    if benchmark_name not in BENCHMARKS:
+      raise app.UsageError(f'Unknown benchmark {benchmark_name}, expected one '
+                           f'of {list(BENCHMARKS)}.')
+
+  start_time = time.monotonic()
+  fixtures = Fixtures(work_dir, random.Random(FLAGS.seed))
+  logging.info(f'Generated fixtures in {time.monotonic() - start_time:.1f}s.')
+
+  results = {
+      'metadata': {
+          'seed': FLAGS.seed,
+          'aports_packages': FLAGS.aports_packages,
+          'spack_packages': FLAGS.spack_packages,
+          'cran_packages': FLAGS.cran_packages,
+          'repeat': FLAGS.repeat,
+          'python': platform.python_version(),
+          'platform': platform.platform(),
+          'cpu_count': os.cpu_count(),
+          'time': time.time(),
+      },
+      'benchmarks': {},
+  }
+  with fixtures.pypi_server:
+    for benchmark_name in benchmark_names:
+      result = run_benchmark(BENCHMARKS[benchmark_name], fixtures)
+      results['benchmarks'][benchmark_name] = result
+      logging.info(f'{benchmark_name}: median {result["median"]:.3f}s, '
+                   f'min {result["min"]:.3f}s, peak memory '
+                   f'{result["peak_memory_bytes"] / 2**20:.1f}MiB.')
+  return results
+
+
+def main(_):
+  if FLAGS.work_dir:
+    os.makedirs(FLAGS.work_dir, exist_ok=True)
+    results = run_benchmarks(FLAGS.work_dir)
+  else:
+    with tempfile.TemporaryDirectory() as work_dir:
+      results = run_benchmarks(work_dir)
+
+  if FLAGS.output_file:
+    with utils.atomic_write(FLAGS.output_file) as output_file:
+      json.dump(results, output_file, indent=2)
+
+  if FLAGS.baseline_file:
+    with open(FLAGS.baseline_file) as baseline_file:
+      baseline = json.load(baseline_file)
+    if compare_to_baseline(results, baseline):
+      return 1
+
+
+if __name__ == '__main__':
+  app.run(main)
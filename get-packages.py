@@ -1,35 +1,255 @@
 """This script gets a list of spack packages and writes them to a CSV.
 """
 
-import spack.repo
-import spack.spec
+import concurrent.futures
+import importlib.util
+import json
+import logging
+import os
+import subprocess
 
 from absl import flags
 from absl import app
 
+from spack_license_utils import package_ast
+from spack_license_utils import utils
+
 FLAGS = flags.FLAGS
 
 flags.DEFINE_string('output_file', None, 'The path to the output CSV file')
+flags.DEFINE_integer(
+    'jobs', None,
+    'The number of processes to evaluate packages with. Defaults to the '
+    'number of cores.')
+flags.DEFINE_bool(
+    'incremental', False,
+    'Record the modification time of each package.py next to the output, and '
+    'only re-evaluate the packages that changed since the existing output '
+    'file was written.')
+flags.DEFINE_string(
+    'since', None,
+    'An (optional) git revision for --incremental. Only packages whose '
+    'package.py changed since it are re-evaluated, instead of comparing '
+    'modification times.')
+flags.DEFINE_string(
+    'packages_dir', None,
+    'The (optional) path to the packages directory of a spack checkout, like '
+    'var/spack/repos/builtin/packages. If set, licenses are read from the '
+    'package.py files without importing Spack, which is only imported for '
+    'the packages that can\'t be read that way.')
 
 flags.mark_flag_as_required('output_file')
 
 
+def get_spack_package_files():
+  # Spack is only imported when it is needed, so --packages_dir works with
+  # just a checkout.
+  import spack.repo
+  return {
+      package: spack.repo.PATH.filename_for_package_name(package)
+      for package in spack.repo.all_package_names(include_virtuals=False)
+  }
+
+
+def get_package_licenses(packages):
+  import spack.repo
+  import spack.spec
+
+  for package in packages:
+    pkg_class = spack.repo.PATH.get_pkg_class(package)
+    pkg = pkg_class(spack.spec.Spec(package))
+
+    license = 'UNKNOWN'
+    license_source = 'NONE'
+    package_licenses = list(pkg.licenses.values())
+    if len(package_licenses) > 0:
+      license = package_licenses[0]
+      license_source = 'Spack'
+
+    yield utils.LicenseRecord(pkg.name, license, license_source)
+
+
+def get_shard_licenses(packages):
+  return list(get_package_licenses(packages))
+
+
+def get_static_shard_licenses(packages, package_files):
+  """Reads licenses from package.py files without importing Spack.
+
+  Returns a LicenseRecord for each package, or the reason it couldn't be
+  read statically.
+  """
+  static_licenses = []
+  for package in packages:
+    try:
+      licenses = package_ast.get_package_file_licenses(package_files[package])
+    except package_ast.UnresolvedLicenseError as error:
+      static_licenses.append(str(error))
+      continue
+    if licenses:
+      license, _ = licenses[0]
+      static_licenses.append(utils.LicenseRecord(package, license, 'Spack'))
+    else:
+      static_licenses.append(utils.LicenseRecord(package, 'UNKNOWN', 'NONE'))
+  return static_licenses
+
+
+def run_shards(executor, shard_function, packages, *args):
+  """Runs shard_function over shards of packages on a process pool.
+
+  Yields (package, result) pairs as shards finish.
+  """
+  jobs = FLAGS.jobs or os.cpu_count()
+  shard_size = utils.get_shard_size(len(packages), jobs)
+  shards = {
+      executor.submit(shard_function, packages[index:index + shard_size],
+                      *args):
+          index for index in range(0, len(packages), shard_size)
+  }
+  for shard in concurrent.futures.as_completed(shards):
+    yield from zip(packages[shards[shard]:], shard.result())
+
+
+def get_package_file_times(package_files):
+  """Returns the modification time of each package's package.py."""
+  return {
+      package: os.stat(package_file).st_mtime_ns
+      for package, package_file in package_files.items()
+  }
+
+
+def get_package_times_file():
+  return f'{FLAGS.output_file}.mtimes'
+
+
+def load_package_file_times():
+  """Returns the package.py modification times recorded by the last run."""
+  package_times_file = get_package_times_file()
+  if not os.path.exists(package_times_file):
+    return {}
+  with open(package_times_file) as package_times:
+    return json.load(package_times)
+
+
+def write_package_file_times(package_file_times):
+  with utils.atomic_write(get_package_times_file()) as package_times:
+    json.dump(package_file_times, package_times)
+
+
+def get_changed_packages(package_files, since):
+  """Returns the packages whose package.py changed since a git revision.
+
+  Uncommitted changes to tracked files are included.
+  """
+  packages_by_path = {
+      os.path.realpath(package_file): package
+      for package, package_file in package_files.items()
+  }
+  packages_dirs = {
+      os.path.dirname(os.path.dirname(package_file))
+      for package_file in package_files.values()
+  }
+  changed_packages = set()
+  for packages_dir in sorted(packages_dirs):
+    git_command_line = [
+        'git', '-C', packages_dir, 'diff', '--name-only', '--relative', since,
+        '--', '.'
+    ]
+    git_diff_process = subprocess.run(
+        git_command_line, stdout=subprocess.PIPE, check=True)
+    for changed_file in git_diff_process.stdout.decode('utf-8').splitlines():
+      changed_path = os.path.realpath(os.path.join(packages_dir, changed_file))
+      if changed_path in packages_by_path:
+        changed_packages.add(packages_by_path[changed_path])
+  return changed_packages
+
+
+def get_reusable_licenses(package_files, package_file_times):
+  """Returns the records from the existing output that are still current."""
+  if not os.path.exists(FLAGS.output_file):
+    return {}
+  previous_licenses = {
+      package_license.name: package_license
+      for package_license in utils.read_license_csv(FLAGS.output_file)
+  }
+
+  changed_packages = set()
+  previous_file_times = {}
+  if FLAGS.since:
+    changed_packages = get_changed_packages(package_files, FLAGS.since)
+  else:
+    previous_file_times = load_package_file_times()
+
+  reusable_licenses = {}
+  for package in package_files:
+    if package not in previous_licenses or package in changed_packages:
+      continue
+    if (not FLAGS.since and
+        previous_file_times.get(package) != package_file_times[package]):
+      continue
+    reusable_licenses[package] = previous_licenses[package]
+  return reusable_licenses
+
+
 def main(_):
-  packages = spack.repo.all_package_names(include_virtuals=False)
+  if FLAGS.since and not FLAGS.incremental:
+    raise app.UsageError('--since requires --incremental.')
+
+  if FLAGS.packages_dir:
+    package_files = package_ast.get_package_files(FLAGS.packages_dir)
+  else:
+    package_files = get_spack_package_files()
+  packages = list(package_files)
+
+  package_licenses = {}
+  package_file_times = {}
+  if FLAGS.incremental:
+    package_file_times = get_package_file_times(package_files)
+    package_licenses = get_reusable_licenses(package_files, package_file_times)
+    logging.info(f'Reusing {len(package_licenses)} of {len(packages)} packages '
+                 f'from {FLAGS.output_file}.')
+
+  changed_packages = [
+      package for package in packages if package not in package_licenses
+  ]
+
+  with concurrent.futures.ProcessPoolExecutor(FLAGS.jobs) as executor:
+    if FLAGS.packages_dir:
+      unresolved_packages = []
+      for package, static_license in run_shards(executor,
+                                                get_static_shard_licenses,
+                                                changed_packages,
+                                                package_files):
+        if isinstance(static_license, str):
+          logging.info(f'Could not read the license of {package} statically: '
+                       f'{static_license}')
+          unresolved_packages.append(package)
+        else:
+          package_licenses[package] = static_license
+      logging.info(f'Read {len(changed_packages) - len(unresolved_packages)} '
+                   f'licenses statically, {len(unresolved_packages)} packages '
+                   'were unresolved.')
+      changed_packages = unresolved_packages
 
-  with open(FLAGS.output_file, 'w') as output_file:
-    for package in packages:
-      pkg_class = spack.repo.PATH.get_pkg_class(package)
-      pkg = pkg_class(spack.spec.Spec(package))
+      if changed_packages and importlib.util.find_spec('spack') is None:
+        logging.warning(
+            'Spack is not importable, so the licenses of the unresolved '
+            f'packages are left unknown: {", ".join(changed_packages)}')
+        for package in changed_packages:
+          package_licenses[package] = utils.LicenseRecord(
+              package, 'UNKNOWN', 'NONE')
+        changed_packages = []
 
-      license = 'UNKNOWN'
-      license_source = 'NONE'
-      package_licenses = list(pkg.licenses.values())
-      if len(package_licenses) > 0:
-        license = package_licenses[0]
-        license_source = 'Spack'
+    for package, package_license in run_shards(executor, get_shard_licenses,
+                                               changed_packages):
+      package_licenses[package] = package_license
 
-      output_file.write(f'{pkg.name},{license},{license_source}\n')
+  utils.write_license_csv(FLAGS.output_file,
+                          (package_licenses[package] for package in packages))
+  # The times are written last, so packages from an interrupted run are
+  # re-evaluated rather than reused.
+  if FLAGS.incremental:
+    write_package_file_times(package_file_times)
 
 
 if __name__ == '__main__':
@@ -2,6 +2,9 @@
 identifiers contained within the repository to improve the license
 information available from there."""
 
+import concurrent.futures
+import csv
+import json
 import logging
 import os
 
@@ -10,28 +13,121 @@ from absl import app
 
 from spack_license_utils import utils
 from spack_license_utils import alpine
+from spack_license_utils import spdx
 
 FLAGS = flags.FLAGS
 
 flags.DEFINE_string('license_json', 'licenses.json',
                     'The path to the licenses JSON file.')
 flags.DEFINE_string('aports_dir', None, 'The path to the aports clone')
+flags.DEFINE_string(
+    'since', None,
+    'An (optional) git revision. Only APKBUILDs changed since it are linted.')
+flags.DEFINE_integer(
+    'jobs', None,
+    'The number of processes to lint with. Defaults to the number of cores.')
+flags.DEFINE_string(
+    'report_file', None,
+    'The (optional) path to write a report of invalid licenses to, grouped '
+    'by invalid license ID. The format is picked by the extension (.json or '
+    '.csv).')
 
 flags.mark_flag_as_required('aports_dir')
 
+_license_map = None
+
+
+def init_worker(license_json):
+  global _license_map
+  _license_map = utils.get_license_list(license_json)
+
+
+def lint_packages(aports_dir, packages):
+  lint_results = []
+  for repository, package in packages:
+    license_value = alpine.get_license(package, repository, aports_dir)
+    if license_value is None:
+      continue
+    invalid_ids = spdx.get_invalid_ids(license_value, _license_map)
+    lint_results.append((repository, package, license_value, invalid_ids))
+  return lint_results
+
+
+def write_report(report_file, invalid_packages, packages_linted):
+  invalid_id_map = {}
+  for repository, package, license_value, invalid_ids in invalid_packages:
+    for invalid_id in invalid_ids:
+      invalid_id_map.setdefault(invalid_id, []).append(
+          (repository, package, license_value))
+
+  if report_file.endswith('.csv'):
+    with open(report_file, 'w', newline='') as report:
+      report_writer = csv.writer(report)
+      report_writer.writerow(['invalid_id', 'repository', 'package', 'license'])
+      for invalid_id in sorted(invalid_id_map):
+        for repository, package, license_value in sorted(
+            invalid_id_map[invalid_id]):
+          report_writer.writerow(
+              [invalid_id, repository, package, license_value])
+  else:
+    invalid_id_json = {}
+    for invalid_id in sorted(invalid_id_map):
+      invalid_id_json[invalid_id] = [{
+          'repository': repository,
+          'package': package,
+          'license': license_value
+      } for repository, package, license_value in sorted(
+          invalid_id_map[invalid_id])]
+    report_json = {
+        'packages_linted': packages_linted,
+        'packages_invalid': len(invalid_packages),
+        'invalid_ids': invalid_id_json
+    }
+    with open(report_file, 'w') as report:
+      json.dump(report_json, report, indent=2)
+
 
 def main(_):
-  packages = alpine.get_package_list(FLAGS.aports_dir)
+  if FLAGS.since:
+    packages = alpine.get_changed_package_list(FLAGS.aports_dir, FLAGS.since)
+  else:
+    packages = alpine.get_package_list(FLAGS.aports_dir)
 
   license_map = utils.get_license_list(FLAGS.license_json)
+  logging.info(
+      f'Linting against SPDX license list {license_map.license_list_version}')
+
+  jobs = FLAGS.jobs or os.cpu_count()
+  shard_size = utils.get_shard_size(len(packages), jobs)
+
+  invalid_packages = []
+  packages_linted = 0
+
+  with concurrent.futures.ProcessPoolExecutor(
+      jobs, initializer=init_worker,
+      initargs=(FLAGS.license_json,)) as executor:
+    shards = [
+        executor.submit(lint_packages, FLAGS.aports_dir,
+                        packages[index:index + shard_size])
+        for index in range(0, len(packages), shard_size)
+    ]
+    for shard in concurrent.futures.as_completed(shards):
+      for repository, package, license_value, invalid_ids in shard.result():
+        packages_linted += 1
+        if not invalid_ids:
+          continue
+        invalid_packages.append(
+            (repository, package, license_value, invalid_ids))
+        print(
+            f'{repository}/{package} has potentially invalid license {license_value}'
+        )
+
+  logging.info(
+      f'Linted {packages_linted} packages, {len(invalid_packages)} have potentially invalid licenses.'
+  )
 
-  for package in packages:
-    license_value = alpine.get_license(package[1], package[0], FLAGS.aports_dir)
-    license_valid = utils.validate_license(license_value, license_map)
-    if not license_valid:
-      print(
-          f'{package[0]}/{package[1]} has potentially invalid license {license_value}'
-      )
+  if FLAGS.report_file:
+    write_report(FLAGS.report_file, invalid_packages, packages_linted)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,10 @@
-"""This script takes a file as input and lints all the license IDs to make sure
-that they are SPDX-standards conforming. Note that this does not fully validate
-that SPDX expressions are valid.
+"""This script takes a file as input and lints all the license expressions to
+make sure that they are SPDX-standards conforming. Each expression is parsed
+according to the SPDX expression grammar (AND, OR, WITH, `+` and parentheses),
+its license IDs are checked against the SPDX license list and its exception
+IDs against the SPDX exception list. LicenseRef- IDs and the custom and
+Public-Domain IDs spack uses are accepted as is. Licenses that don't pass are
+logged and reset to UNKNOWN in the output file.
 """
 
 import logging
@@ -26,15 +30,13 @@ def main(_):
   package_licenses = utils.load_license_csv(FLAGS.input_file)
 
   license_map = utils.get_license_list(FLAGS.license_json)
+  logging.info(
+      f'Linting against SPDX license list {license_map.license_list_version}')
 
-  for package_license in package_licenses:
-    if package_license[1] == 'UNKNOWN':
-      continue
-    if not utils.validate_license(package_license[1], license_map):
-      logging.warning(
-          f'{package_license[0]} has invalid license string "{package_license[1]}"'
-      )
-      package_license[1] = 'UNKNOWN'
+  for package_name, invalid_license in utils.lint_package_licenses(
+      package_licenses, license_map):
+    logging.warning(
+        f'{package_name} has invalid license string "{invalid_license}"')
 
   if FLAGS.output_file:
     utils.write_license_csv(FLAGS.output_file, package_licenses)
@@ -0,0 +1,86 @@
+"""This script merges the license CSVs written by the individual sources into
+one, picking a license per package by source priority or confidence instead
+of by the order the sources were run in.
+"""
+
+import csv
+import logging
+
+from absl import flags
+from absl import app
+
+from spack_license_utils import utils
+from spack_license_utils import merge
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_list('input_files', None,
+                  'The paths to the license CSVs to merge, in any order.')
+flags.DEFINE_string('output_file', None, 'The path to the merged CSV file.')
+flags.DEFINE_list(
+    'priority', merge.DEFAULT_PRIORITY,
+    'The sources in the order their licenses take precedence. Sources not '
+    'listed rank after the listed ones.')
+flags.DEFINE_enum(
+    'policy', 'priority', merge.POLICIES,
+    'Whether to prefer licenses from higher priority sources, breaking ties by '
+    'confidence, or the most confident licenses, breaking ties by priority.')
+flags.DEFINE_float(
+    'min_confidence', None,
+    'The (optional) confidence below which candidate licenses are ignored.')
+flags.DEFINE_string(
+    'provenance_file', None,
+    'The (optional) path to write a CSV with the chosen license, every '
+    'candidate license and whether the candidates conflict for each package.')
+
+flags.mark_flag_as_required('input_files')
+flags.mark_flag_as_required('output_file')
+
+
+def main(_):
+  merge_policy = merge.MergePolicy(FLAGS.priority, FLAGS.policy,
+                                   FLAGS.min_confidence)
+  merge_results = merge.merge_license_csvs(FLAGS.input_files, merge_policy)
+
+  package_count = 0
+  unknown_count = 0
+  conflict_count = 0
+
+  def get_merged_records(provenance_writer):
+    nonlocal package_count, unknown_count, conflict_count
+    for merge_result in merge_results:
+      package_count += 1
+      if not merge_result.candidates:
+        unknown_count += 1
+      if merge_result.conflict:
+        conflict_count += 1
+        logging.warning(
+            f'Sources disagree on the license of {merge_result.record.name}')
+      if provenance_writer:
+        provenance_writer.writerow([
+            merge_result.record.name, merge_result.record.license,
+            merge_result.record.source,
+            ';'.join(f'{candidate.source}={candidate.license}'
+                     for candidate in merge_result.candidates),
+            int(merge_result.conflict)
+        ])
+      yield merge_result.record
+
+  if FLAGS.provenance_file:
+    with utils.atomic_write(
+        FLAGS.provenance_file, newline='') as provenance_file:
+      provenance_writer = csv.writer(provenance_file, lineterminator='\n')
+      provenance_writer.writerow(
+          ['package', 'license', 'source', 'candidates', 'conflict'])
+      utils.write_license_csv(FLAGS.output_file,
+                              get_merged_records(provenance_writer))
+  else:
+    utils.write_license_csv(FLAGS.output_file, get_merged_records(None))
+
+  logging.info(f'Merged {package_count} packages from '
+               f'{len(FLAGS.input_files)} files, {unknown_count} are unknown '
+               f'and {conflict_count} have conflicting candidates.')
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,283 @@
+"""This script runs the license sources over the package CSV in a single
+process. The package table is loaded once, the independent sources (Alpine,
+CRAN and PyPI) run concurrently, and the output is only written at the end.
+"""
+
+import concurrent.futures
+import logging
+import time
+
+from absl import flags
+from absl import app
+
+from spack_license_utils import utils
+from spack_license_utils import alpine
+from spack_license_utils import cran
+from spack_license_utils import pypi
+from spack_license_utils import http_cache
+from spack_license_utils import license_store
+from spack_license_utils import names
+from spack_license_utils import executors
+from spack_license_utils import stage
+
+FLAGS = flags.FLAGS
+
+# The sources in the order their results take precedence, which matches the
+# order the individual scripts have traditionally been chained in.
+SOURCES = ['alpine', 'cran', 'pypi', 'detect']
+
+flags.DEFINE_string('input_file', None,
+                    'The path to the input CSV file from get-packages.py.')
+flags.DEFINE_string('output_file', None, 'The path to the output CSV file.')
+flags.DEFINE_string(
+    'store', None,
+    'The (optional) path to a SQLite license store to read packages from and '
+    'write licenses to, in place of the CSV files. If --input_file is set it '
+    'is imported into the store first, and if --output_file is set the store '
+    'is exported to it at the end.')
+flags.DEFINE_string('license_json', 'licenses.json',
+                    'The path to the licenses JSON file.')
+flags.DEFINE_list(
+    'sources', ['alpine', 'cran', 'pypi'],
+    f'The license sources to use, out of {SOURCES}. detect runs after the '
+    'others, over the packages that are still unknown.')
+flags.DEFINE_string('aports_dir', None,
+                    'The path to the aports clone, for the alpine source.')
+flags.DEFINE_string(
+    'index_cache', None,
+    'The (optional) path to a file to cache parsed aports license info in.')
+flags.DEFINE_string(
+    'packages_file', None,
+    'The path to a CRAN PACKAGES or PACKAGES.gz file, or to a local CRAN '
+    'mirror containing one, for the cran source.')
+flags.DEFINE_string(
+    'r_licenses_file', None,
+    'The path to the file written by gather-r-licenses.R, for the cran source '
+    'if --packages_file is not set.')
+flags.DEFINE_string('pypi_url', pypi.PYPI_URL,
+                    'The base URL of the PyPI instance to query.')
+flags.DEFINE_integer('max_connections', 16,
+                     'The maximum number of PyPI requests to have in flight.')
+flags.DEFINE_integer(
+    'max_retries', 5,
+    'The number of times to retry a request that is rate limited or fails.')
+flags.DEFINE_string(
+    'cache_file', None,
+    'The (optional) path to a SQLite database to cache PyPI responses in.')
+flags.DEFINE_integer(
+    'cache_ttl', http_cache.DEFAULT_TTL,
+    'The number of seconds a cached response is used before revalidating it.')
+flags.DEFINE_bool('offline', False, 'Only serve PyPI responses from the cache.')
+flags.DEFINE_enum(
+    'executor', executors.DEFAULT_EXECUTOR, executors.EXECUTORS,
+    'Where the detect source runs staging and detection: on a Ray cluster, or '
+    'in a local process or thread pool.')
+flags.DEFINE_string(
+    'license_texts_dir', None,
+    'The (optional) path to a directory of SPDX license texts, which the '
+    'detect source matches license files against before running the license '
+    'detector.')
+flags.DEFINE_float(
+    'name_threshold', None,
+    'Also match packages to upstream names in the alpine, cran and pypi '
+    'sources that are the same once language prefixes, lib prefixes, -dev '
+    'style suffixes and separators are ignored, with 0.95 in the confidence '
+    'column. Other upstream names scoring at least this (from 0 to 1) are '
+    'logged as candidates, but not used.')
+flags.DEFINE_bool('lint', True,
+                  'Reset licenses that are not valid SPDX expressions.')
+flags.DEFINE_bool('upgrade_deprecated', True,
+                  'Upgrade deprecated SPDX license IDs.')
+
+
+def resolve_names(package_names, upstream_names, prefix=''):
+  if FLAGS.name_threshold is None:
+    return {}
+  return names.resolve_names(package_names, upstream_names,
+                             FLAGS.name_threshold, prefix)
+
+
+def get_alpine_licenses(package_names, license_map):
+  license_index = alpine.get_license_index(FLAGS.aports_dir, FLAGS.index_cache)
+  resolved_names = resolve_names(package_names, license_index)
+  return alpine.get_package_licenses(
+      package_names, license_index,
+      resolved_names), names.get_confidences(resolved_names)
+
+
+def get_cran_licenses(package_names, license_map):
+  if FLAGS.packages_file:
+    r_package_licenses = cran.load_packages_licenses(FLAGS.packages_file)
+  else:
+    r_package_licenses = cran.load_r_licenses(FLAGS.r_licenses_file)
+  resolved_names = resolve_names(package_names, r_package_licenses, 'r-')
+  return cran.get_package_licenses(
+      package_names, r_package_licenses,
+      resolved_names), names.get_confidences(resolved_names)
+
+
+def get_pypi_licenses(package_names, license_map):
+  response_cache = None
+  if FLAGS.cache_file:
+    response_cache = http_cache.ResponseCache(FLAGS.cache_file, FLAGS.cache_ttl,
+                                              FLAGS.offline)
+  session = pypi.create_session(max_retries=FLAGS.max_retries)
+  package_name_index = pypi.get_package_name_index(
+      session, FLAGS.pypi_url, FLAGS.cache_file and
+      f'{FLAGS.cache_file}.names.gz', FLAGS.cache_ttl, FLAGS.offline)
+  resolved_names = resolve_names(package_names, package_name_index, 'py-')
+  package_licenses = pypi.get_package_licenses(
+      package_names, license_map, package_name_index, FLAGS.max_connections,
+      FLAGS.pypi_url, FLAGS.max_retries, response_cache, resolved_names)
+  if response_cache is not None:
+    response_cache.evict()
+    response_cache.close()
+  return package_licenses, names.get_confidences(resolved_names)
+
+
+def get_detected_licenses(package_names, license_map):
+  return stage.get_package_licenses(
+      package_names,
+      executor_name=FLAGS.executor,
+      license_texts_dir=FLAGS.license_texts_dir), {}
+
+
+SOURCE_FUNCTIONS = {
+    'alpine': (get_alpine_licenses, 'Alpine'),
+    'cran': (get_cran_licenses, 'Cran'),
+    'pypi': (get_pypi_licenses, 'Pypi'),
+    'detect': (get_detected_licenses, 'Detected'),
+}
+
+
+def run_source(source, package_names, license_map):
+  """Returns the licenses a source found, and their confidences."""
+  start_time = time.monotonic()
+  source_function, _ = SOURCE_FUNCTIONS[source]
+  source_licenses, source_confidences = source_function(package_names,
+                                                        license_map)
+  logging.info(f'{source} found {len(source_licenses)} licenses in '
+               f'{time.monotonic() - start_time:.1f}s.')
+  return source_licenses, source_confidences
+
+
+def get_unknown_package_names(package_licenses, store):
+  if store is not None:
+    return store.get_unknown_package_names()
+  return utils.get_unknown_package_names(package_licenses)
+
+
+def apply_source_licenses(package_licenses, store, source, source_results):
+  _, source_name = SOURCE_FUNCTIONS[source]
+  source_licenses, source_confidences = source_results
+  if store is not None:
+    applied_count = store.apply_licenses(source_licenses, source_name,
+                                         source_confidences)
+  else:
+    applied_count = utils.apply_package_licenses(package_licenses,
+                                                 source_licenses, source_name,
+                                                 source_confidences)
+  logging.info(f'Tagged {applied_count} packages with licenses from {source}.')
+
+
+def clean_package_licenses(package_licenses, license_map):
+  """Upgrades deprecated IDs and lints licenses as configured.
+
+  Returns the records that changed.
+  """
+  original_licenses = [
+      package_license.license for package_license in package_licenses
+  ]
+
+  if FLAGS.upgrade_deprecated:
+    for package_license in package_licenses:
+      package_license.license = utils.upgrade_deprecated_spdx_id(
+          package_license.license)
+
+  if FLAGS.lint:
+    for package_name, invalid_license in utils.lint_package_licenses(
+        package_licenses, license_map):
+      logging.warning(
+          f'{package_name} has invalid license string "{invalid_license}"')
+
+  return [
+      package_license for package_license, original_license in zip(
+          package_licenses, original_licenses)
+      if package_license.license != original_license
+  ]
+
+
+def main(_):
+  if not FLAGS.store and not (FLAGS.input_file and FLAGS.output_file):
+    raise app.UsageError(
+        '--input_file and --output_file are required without --store.')
+  for source in FLAGS.sources:
+    if source not in SOURCES:
+      raise app.UsageError(
+          f'Unknown source {source}, expected one of {SOURCES}.')
+  if 'alpine' in FLAGS.sources and not FLAGS.aports_dir:
+    raise app.UsageError('The alpine source requires --aports_dir.')
+  if 'cran' in FLAGS.sources and not (FLAGS.packages_file or
+                                      FLAGS.r_licenses_file):
+    raise app.UsageError(
+        'The cran source requires --packages_file or --r_licenses_file.')
+  if FLAGS.offline and not FLAGS.cache_file:
+    raise app.UsageError('--offline requires --cache_file.')
+
+  license_map = utils.get_license_list(FLAGS.license_json)
+  store = None
+  package_licenses = None
+  if FLAGS.store:
+    store = license_store.LicenseStore(FLAGS.store)
+    if FLAGS.input_file:
+      imported_count = store.import_csv(FLAGS.input_file)
+      logging.info(f'Imported {imported_count} new or changed packages into '
+                   f'{FLAGS.store}.')
+  else:
+    package_licenses = utils.load_license_csv(FLAGS.input_file)
+
+  concurrent_sources = [
+      source for source in SOURCES
+      if source in FLAGS.sources and source != 'detect'
+  ]
+  package_names = get_unknown_package_names(package_licenses, store)
+
+  # Every source sees the same set of unknown packages. The results are
+  # applied in SOURCES order so the outcome doesn't depend on which source
+  # finishes first.
+  with concurrent.futures.ThreadPoolExecutor(max(
+      1, len(concurrent_sources))) as executor:
+    source_futures = {
+        source: executor.submit(run_source, source, package_names, license_map)
+        for source in concurrent_sources
+    }
+    for source in concurrent_sources:
+      apply_source_licenses(package_licenses, store, source,
+                            source_futures[source].result())
+
+  if 'detect' in FLAGS.sources:
+    package_names = get_unknown_package_names(package_licenses, store)
+    apply_source_licenses(package_licenses, store, 'detect',
+                          run_source('detect', package_names, license_map))
+
+  if store is not None:
+    # Only the rows that cleaning changed are written back.
+    store.upsert(clean_package_licenses(list(store.get_records()), license_map))
+    if FLAGS.output_file:
+      store.export_csv(FLAGS.output_file)
+    package_count = len(store)
+    unknown_count = len(store.get_unknown_package_names())
+    store.close()
+  else:
+    clean_package_licenses(package_licenses, license_map)
+    utils.write_license_csv(FLAGS.output_file, package_licenses)
+    package_count = len(package_licenses)
+    unknown_count = len(utils.get_unknown_package_names(package_licenses))
+
+  logging.info(
+      f'{package_count - unknown_count} of {package_count} packages have license information.'
+  )
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -2,18 +2,14 @@
 """
 
 import logging
-import requests
-import json
 
 from absl import flags
 from absl import app
 
-from bs4 import BeautifulSoup
-from bs4 import SoupStrainer
-
-from tqdm import tqdm
-
 from spack_license_utils import utils
+from spack_license_utils import pypi
+from spack_license_utils import http_cache
+from spack_license_utils import names
 
 FLAGS = flags.FLAGS
 
@@ -21,82 +17,79 @@ flags.DEFINE_string('input_file', None, 'The path to the input CSV file.')
 flags.DEFINE_string('output_file', None, 'The path to the output CSV file.')
 flags.DEFINE_string('license_json', 'licenses.json',
                     'The path to the license JSON file.')
+flags.DEFINE_string('pypi_url', pypi.PYPI_URL,
+                    'The base URL of the PyPI instance to query.')
+flags.DEFINE_integer('max_connections', 16,
+                     'The maximum number of requests to have in flight.')
+flags.DEFINE_integer(
+    'max_retries', 5,
+    'The number of times to retry a request that is rate limited or fails.')
+flags.DEFINE_string(
+    'cache_file', None,
+    'The (optional) path to a SQLite database to cache PyPI responses in.')
+flags.DEFINE_integer(
+    'cache_ttl', http_cache.DEFAULT_TTL,
+    'The number of seconds a cached response is used before revalidating it.')
+flags.DEFINE_integer('cache_max_age', http_cache.DEFAULT_MAX_AGE,
+                     'The number of seconds after which to evict a response.')
+flags.DEFINE_integer('cache_max_bytes', http_cache.DEFAULT_MAX_BYTES,
+                     'The maximum total size of the cached responses.')
+flags.DEFINE_bool('offline', False,
+                  'Only serve responses from the cache, never the network.')
+flags.DEFINE_float(
+    'name_threshold', None,
+    'Also match packages to PyPI names that are the same once language '
+    'prefixes, lib prefixes, -dev style suffixes and separators are ignored, '
+    'with 0.95 in the confidence column. Other PyPI names scoring at least '
+    'this (from 0 to 1) are logged as candidates, but not used.')
 
 flags.mark_flag_as_required('input_file')
 flags.mark_flag_as_required('output_file')
 
 
-def get_package_map():
-  package_map = {}
-
-  pypi_package_index = requests.get('https://pypi.org/simple')
-
-  for package_link in BeautifulSoup(
-      pypi_package_index.content,
-      parse_only=SoupStrainer('a'),
-      features="html.parser"):
-    package_name = package_link.text
-    package_map[package_name.upper()] = package_name
-
-  return package_map
-
-
-def get_license_info(package_name, license_list):
-  api_endpoint = f'https://pypi.org/pypi/{package_name}/json'
-
-  package_info_raw = requests.get(api_endpoint)
-
-  package_info = json.loads(package_info_raw.content)
-
-  if 'info' not in package_info or 'license' not in package_info['info']:
-    return None
-
-  license_string = package_info['info']['license']
-
-  if license_string is None:
-    return None
-
-  license_string = license_string.replace(' ', '-')
-  if license_string in license_list:
-    return license_string
-
-  return None
+def main(_):
+  if FLAGS.offline and not FLAGS.cache_file:
+    raise app.UsageError('--offline requires --cache_file.')
 
+  response_cache = None
+  if FLAGS.cache_file:
+    response_cache = http_cache.ResponseCache(FLAGS.cache_file, FLAGS.cache_ttl,
+                                              FLAGS.offline)
 
-def main(_):
   license_list = utils.get_license_list(FLAGS.license_json)
 
   package_licenses = utils.load_license_csv(FLAGS.input_file)
 
   logging.info('Grabbing package list from pypi.')
-  package_map = get_package_map()
+  session = pypi.create_session(max_retries=FLAGS.max_retries)
+  package_name_index = pypi.get_package_name_index(
+      session, FLAGS.pypi_url, FLAGS.cache_file and
+      f'{FLAGS.cache_file}.names.gz', FLAGS.cache_ttl, FLAGS.offline)
   logging.info(
       'Finished grabbing package list from pypi, tagging spack packages.')
 
-  packages_with_license = 0
-  packages_without_license = 0
-
-  for package_license in tqdm(package_licenses, miniters=1):
-    # Skip packages that already have license info
-    if package_license[1] != 'UNKNOWN':
-      continue
-    # Skip non-python packages
-    if not package_license[0].startswith('py-'):
-      continue
-
-    # We have a python package
-    pypi_name = package_license[0][3:].upper()
-    if pypi_name in package_map:
-      pkg_license = get_license_info(package_map[pypi_name], license_list)
-      if pkg_license:
-        packages_with_license += 1
-        package_license[1] = pkg_license
-        package_license[2] = 'Pypi'
-      else:
-        packages_without_license += 1
+  python_package_names = utils.get_unknown_package_names(
+      package_licenses, 'py-')
+  resolved_names = {}
+  if FLAGS.name_threshold is not None:
+    resolved_names = names.resolve_names(python_package_names,
+                                         package_name_index,
+                                         FLAGS.name_threshold, 'py-')
+  packages_with_license = utils.apply_package_licenses(
+      package_licenses,
+      pypi.get_package_licenses(python_package_names, license_list,
+                                package_name_index, FLAGS.max_connections,
+                                FLAGS.pypi_url, FLAGS.max_retries,
+                                response_cache, resolved_names), 'Pypi',
+      names.get_confidences(resolved_names))
+  packages_without_license = len(python_package_names) - packages_with_license
 
   utils.write_license_csv(FLAGS.output_file, package_licenses)
 
+  if response_cache is not None:
+    response_cache.evict(FLAGS.cache_max_age, FLAGS.cache_max_bytes)
+    response_cache.close()
+
   logging.info(
       f'Tagged {packages_with_license} packages with license information.')
   logging.info(
@@ -1,37 +1,204 @@
 """Utilities for working with the Alpine Linux aports repository.
 """
 
+import concurrent.futures
+import json
+import multiprocessing
 import os
+import subprocess
+
+from spack_license_utils import utils
+
+# The aports repositories, in the order they should be searched when a package
+# name exists in more than one of them.
+REPOSITORIES = ['main', 'community', 'testing']
+
+INDEX_VERSION = 1
 
 
 def get_package_list(aports_dir):
   packages = []
-  for main_package in os.listdir(os.path.join(aports_dir, 'main')):
-    if main_package == '.rootbld-repositories':
-      continue
-    packages.append(('main', main_package))
-  for community_package in os.listdir(os.path.join(aports_dir, 'community')):
-    if community_package == '.rootbld-repositories':
+  for repository in REPOSITORIES:
+    for package in os.listdir(os.path.join(aports_dir, repository)):
+      if package == '.rootbld-repositories':
+        continue
+      packages.append((repository, package))
+  return packages
+
+
+def get_changed_package_list(aports_dir, since):
+  """Returns the packages whose APKBUILD changed since the given git revision.
+
+  Uncommitted changes to tracked APKBUILDs are included. Packages that have
+  since been deleted are not.
+  """
+  git_command_line = [
+      'git', '-C', aports_dir, 'diff', '--name-only', since, '--', '*/APKBUILD'
+  ]
+  git_diff_process = subprocess.run(
+      git_command_line, stdout=subprocess.PIPE, check=True)
+  packages = []
+  for changed_file in git_diff_process.stdout.decode('utf-8').splitlines():
+    path_parts = changed_file.split('/')
+    if len(path_parts) != 3 or path_parts[0] not in REPOSITORIES:
       continue
-    packages.append(('community', community_package))
-  for testing_package in os.listdir(os.path.join(aports_dir, 'testing')):
-    if testing_package == '.rootbld-repositories':
+    if not os.path.exists(os.path.join(aports_dir, changed_file)):
       continue
-    packages.append(('testing', testing_package))
+    packages.append((path_parts[0], path_parts[1]))
   return packages
 
 
+def parse_license(apkbuild_file):
+  """Extracts the license field from an open APKBUILD file.
+
+  Handles license values that are quoted and span multiple lines, joining the
+  lines with single spaces. Returns None if there is no license field.
+  """
+  for line in apkbuild_file:
+    if not line.startswith('license='):
+      continue
+    value = line[8:].rstrip('\n')
+    if not value or value[0] not in '"\'':
+      # If we're reaching this path, it's probably because there aren't
+      # any quotes around the license string
+      return value
+    quote = value[0]
+    value = value[1:]
+    license_parts = []
+    while quote not in value:
+      license_parts.append(value)
+      value = next(apkbuild_file, quote).rstrip('\n')
+    license_parts.append(value.split(quote)[0])
+    return ' '.join(license_part.strip()
+                    for license_part in license_parts
+                    if license_part.strip())
+  return None
+
+
 def get_license(package_name, package_repository, aports_dir):
   # This assums that the package exists
   apkbuild_path = os.path.join(aports_dir, package_repository, package_name,
                                'APKBUILD')
   with open(apkbuild_path) as apkbuild_file:
-    apk_lines = apkbuild_file.readlines()
-    for line in apk_lines:
-      if line.startswith('license='):
-        line_parts = line.split('"')
-        if len(line_parts) < 2:
-          # If we're reaching this path, it's probably because there aren't
-          # any quotes around the license string
-          return line[8:-1]
-        return line_parts[1]
+    return parse_license(apkbuild_file)
+
+
+def _get_licenses(aports_dir, packages):
+  return [(repository, package, get_license(package, repository, aports_dir))
+          for repository, package in packages]
+
+
+def _get_apkbuild_mtimes(aports_dir):
+  apkbuild_mtimes = {}
+  for repository, package in get_package_list(aports_dir):
+    apkbuild_path = os.path.join(aports_dir, repository, package, 'APKBUILD')
+    try:
+      apkbuild_mtimes[(repository,
+                       package)] = os.stat(apkbuild_path).st_mtime_ns
+    except FileNotFoundError:
+      continue
+  return apkbuild_mtimes
+
+
+def _load_index_cache(cache_file):
+  if not cache_file or not os.path.exists(cache_file):
+    return {}
+  with open(cache_file) as cache:
+    cache_json = json.load(cache)
+  if cache_json.get('version') != INDEX_VERSION:
+    return {}
+  return {
+      tuple(key.split('/', 1)): tuple(value)
+      for key, value in cache_json['packages'].items()
+  }
+
+
+def _write_index_cache(cache_file, cached_licenses):
+  cache_json = {
+      'version': INDEX_VERSION,
+      'packages': {
+          f'{repository}/{package}': list(value)
+          for (repository, package), value in cached_licenses.items()
+      }
+  }
+  with utils.atomic_write(cache_file) as cache:
+    json.dump(cache_json, cache)
+
+
+def get_license_map(aports_dir, cache_file=None, max_workers=None):
+  """Returns a mapping from (repository, package) to the license field.
+
+  The APKBUILDs are parsed in parallel. If cache_file is set, the parsed
+  licenses are stored there along with the modification time of each
+  APKBUILD so that later calls only need to re-parse APKBUILDs that changed.
+  """
+  apkbuild_mtimes = _get_apkbuild_mtimes(aports_dir)
+  cached_licenses = _load_index_cache(cache_file)
+
+  license_map = {}
+  stale_packages = []
+  for package, mtime in apkbuild_mtimes.items():
+    if package in cached_licenses and cached_licenses[package][0] == mtime:
+      license_map[package] = cached_licenses[package][1]
+    else:
+      stale_packages.append(package)
+
+  if stale_packages:
+    max_workers = max_workers or os.cpu_count()
+    shard_size = utils.get_shard_size(len(stale_packages), max_workers)
+    # Workers are started from a fork server rather than forked directly, as
+    # this can be called from a thread (like in pipeline.py) and forking a
+    # multithreaded process can deadlock the child.
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers,
+        mp_context=multiprocessing.get_context('forkserver')) as executor:
+      shards = [
+          executor.submit(_get_licenses, aports_dir,
+                          stale_packages[index:index + shard_size])
+          for index in range(0, len(stale_packages), shard_size)
+      ]
+      for shard in concurrent.futures.as_completed(shards):
+        for repository, package, pkg_license in shard.result():
+          license_map[(repository, package)] = pkg_license
+
+  if cache_file and (stale_packages or
+                     len(cached_licenses) != len(apkbuild_mtimes)):
+    _write_index_cache(
+        cache_file, {
+            package: (mtime, license_map[package])
+            for package, mtime in apkbuild_mtimes.items()
+        })
+
+  return license_map
+
+
+def get_license_index(aports_dir, cache_file=None, max_workers=None):
+  """Returns a mapping from package name to (repository, license).
+
+  If a package exists in more than one repository, the repository that comes
+  first in REPOSITORIES wins.
+  """
+  license_index = {}
+  license_map = get_license_map(aports_dir, cache_file, max_workers)
+  for repository in REPOSITORIES:
+    for (package_repository, package), pkg_license in license_map.items():
+      if package_repository == repository and package not in license_index:
+        license_index[package] = (repository, pkg_license)
+  return license_index
+
+
+def get_package_licenses(package_names, license_index, resolved_names=None):
+  """Returns a mapping from package name to license for packages in aports.
+
+  resolved_names optionally maps package names to (aports name, score), as
+  returned by names.resolve_names, for packages named differently in aports.
+  """
+  package_licenses = {}
+  for package_name in package_names:
+    aports_name = package_name
+    if resolved_names and package_name in resolved_names:
+      aports_name, _ = resolved_names[package_name]
+    _, pkg_license = license_index.get(aports_name, (None, None))
+    if pkg_license:
+      package_licenses[package_name] = pkg_license
+  return package_licenses
@@ -0,0 +1,108 @@
+"""A compiled catalog of the SPDX license and exception lists.
+
+Parsing the SPDX license list JSON is slow relative to how little of it is
+used, so the IDs and deprecation flags are compiled into a marshal snapshot
+next to the JSON file. The snapshot is rebuilt whenever the JSON files change.
+"""
+
+import functools
+import json
+import os
+
+from spack_license_utils import snapshot
+from spack_license_utils import spdx
+
+SNAPSHOT_VERSION = 1
+
+
+class Catalog:
+  """The license and exception IDs from a version of the SPDX license list.
+
+  Membership tests (`license_id in catalog`) are against license IDs, so a
+  catalog can be used wherever a license map is expected.
+  """
+
+  def __init__(self, license_list_version, licenses, deprecated_licenses,
+               exceptions, deprecated_exceptions):
+    self.license_list_version = license_list_version
+    self.licenses = licenses
+    self.deprecated_licenses = deprecated_licenses
+    self.exceptions = exceptions
+    self.deprecated_exceptions = deprecated_exceptions
+
+  def __contains__(self, license_id):
+    return license_id in self.licenses
+
+  def __len__(self):
+    return len(self.licenses)
+
+  @functools.cached_property
+  def _folded_licenses(self):
+    return {license_id.lower(): license_id for license_id in self.licenses}
+
+  @functools.cached_property
+  def _folded_exceptions(self):
+    return {exception.lower(): exception for exception in self.exceptions}
+
+  def lookup(self, license_id):
+    """Returns the canonical spelling of a license ID, or None."""
+    return self._folded_licenses.get(license_id.lower())
+
+  def lookup_exception(self, exception):
+    """Returns the canonical spelling of an exception ID, or None."""
+    return self._folded_exceptions.get(exception.lower())
+
+  def is_deprecated(self, spdx_id):
+    return (spdx_id in self.deprecated_licenses or
+            spdx_id in self.deprecated_exceptions)
+
+
+def _get_source_signature(source_paths):
+  signature = []
+  for source_path in source_paths:
+    if os.path.exists(source_path):
+      source_stat = os.stat(source_path)
+      signature.append(
+          (source_path, source_stat.st_size, source_stat.st_mtime_ns))
+  return tuple(signature)
+
+
+def _compile(license_json, exceptions_json):
+  with open(license_json) as license_list_file:
+    licenses_json = json.load(license_list_file)
+  licenses = frozenset(lic['licenseId'] for lic in licenses_json['licenses'])
+  deprecated_licenses = frozenset(lic['licenseId']
+                                  for lic in licenses_json['licenses']
+                                  if lic.get('isDeprecatedLicenseId'))
+
+  exceptions = set(spdx.DEFAULT_EXCEPTIONS)
+  deprecated_exceptions = set()
+  if os.path.exists(exceptions_json):
+    with open(exceptions_json) as exception_list_file:
+      exceptions_list_json = json.load(exception_list_file)
+    for exception in exceptions_list_json['exceptions']:
+      exceptions.add(exception['licenseExceptionId'])
+      if exception.get('isDeprecatedLicenseId'):
+        deprecated_exceptions.add(exception['licenseExceptionId'])
+
+  return (licenses_json['licenseListVersion'], licenses, deprecated_licenses,
+          frozenset(exceptions), frozenset(deprecated_exceptions))
+
+
+@functools.cache
+def load_catalog(license_json, exceptions_json=None):
+  """Loads the catalog for an SPDX license list JSON file.
+
+  The exception list is read from exceptions_json, which defaults to
+  exceptions.json next to license_json. If it doesn't exist, only the
+  exceptions in spdx.DEFAULT_EXCEPTIONS are known. Catalogs are cached per
+  process, and compiled snapshots are stored in license_json + '.catalog'.
+  """
+  if exceptions_json is None:
+    exceptions_json = os.path.join(
+        os.path.dirname(license_json), 'exceptions.json')
+  source_signature = _get_source_signature([license_json, exceptions_json])
+  catalog_fields = snapshot.load_snapshot(
+      f'{license_json}.catalog', SNAPSHOT_VERSION, source_signature,
+      lambda: _compile(license_json, exceptions_json))
+  return Catalog(*catalog_fields)
@@ -0,0 +1,285 @@
+"""Utilities for working with license information from CRAN.
+"""
+
+import collections
+import csv
+import functools
+import gzip
+import logging
+import os
+import re
+
+NormalizedLicense = collections.namedtuple('NormalizedLicense',
+                                           ['license', 'rule'])
+
+# License strings from CRAN that map directly to an SPDX expression.
+EXACT_LICENSES = {
+    'GPL': 'GPL-2.0-or-later',
+    'GNU General Public License': 'GPL-2.0-or-later',
+    'GPL-3': 'GPL-3.0-only',
+    'GNU General Public License version 3': 'GPL-3.0-only',
+    'MIT': 'MIT',
+    'MIT License': 'MIT',
+    'GPL-2': 'GPL-2.0-only',
+    'file LICENSE': 'custom',
+    'file LICENCE': 'custom',
+    'LGPL': 'LGPL-2.0-or-later',
+    'Apache License (>= 2)': 'Apache-2.0+',
+    'Apache License (>= 2.0)': 'Apache-2.0+',
+    'Apache License (== 2)': 'Apache-2.0',
+    'Apache License Version 2.0': 'Apache-2.0',
+    'EUPL': 'EUPL-1.2',
+    'Apache License': 'Apache-1.1+',
+    'BSD_3_clause': 'BSD-3-Clause',
+    'BSD 3-clause License': 'BSD-3-Clause',
+    'BSD_2_clause': 'BSD-2-Clause',
+    'BSD 2-clause License': 'BSD-2-Clause',
+    'Apache License (== 2.0)': 'Apache-2.0',
+    'Apache License 2.0': 'Apache-2.0',
+    'AGPL-3': 'AGPL-3.0-only',
+    'CC0': 'CC0-1.0',
+    'Creative Commons Attribution 4.0 International License': 'CC-BY-4.0',
+    # This is the ACM license which isn't recognized by SPDX currently.
+    # In addition, this license isn't used very commonly.
+    'ACM': 'custom',
+    # This seems to be a license specifically to CRAN for distribution.
+    # also not recognized by SPDX, and the specific terms are unclear.
+    'Unlimited': 'custom',
+    'CeCILL-2': 'CECILL-2.0',
+    'CeCILL (>= 2)': 'CECILL-2.0+',
+    'CECILL-2.1': 'CECILL-2.1',
+    'LGPL-3': 'LGPL-3.0-only',
+    'Artistic-2.0': 'Artistic-2.0',
+    'Artistic License 2.0': 'Artistic-2.0',
+    'LGPL-2.1': 'LGPL-2.1-only',
+    'MPL': 'MPL-1.0+',
+    'BSL-1.0': 'BSL-1.0',
+    'BSL': 'BSL-1.0',
+    'LGPL-2': 'LGPL-2.0-only',
+    'AGPL': 'AGPL-1.0-or-later',
+    'FreeBSD': 'BSD-2-Clause',
+    'EUPL (>= 1.2)': 'EUPL-1.2+',
+    'Mozilla Public License 2.0': 'MPL-2.0',
+    'MPL-2.0': 'MPL-2.0',
+    'MPL (== 2.0)': 'MPL-2.0',
+    'Mozilla Public License Version 2.0': 'MPL-2.0',
+    'CeCILL': 'CeCILL-2.0+',
+    'GNU General Public License version 2': 'GPL-2.0-only',
+    'EPL': 'EPL-1.0',
+    'MPL (>= 2)': 'MPL-2.0+',
+    'MPL (>= 2.0)': 'MPL-2.0+',
+    'EUPL-1.1': 'EUPL-1.1',
+    'MPL-1.1': 'MPL-1.1',
+    'Mozilla Public License 1.1': 'MPL-1.1',
+    'Common Public License Version 1.0': 'CPL-1.0',
+    'CPL-1.0': 'CPL-1.0',
+    'Lucent Public License': 'LPL-1.02',
+    'GNU Lesser General Public License': 'LGPL-2.1-or-later',
+    # Seems to be a typo, there is no CPL-2.0
+    'CPL (>= 2)': 'CPL-1.0+',
+}
+
+_FILE_SUFFIX_REGEX = re.compile(r'^(.+?)\s*\+\s*file LICEN[CS]E$')
+
+# Matches version range forms like "GPL (>= 2)", "LGPL (== 2.1)" and the
+# occasional "LGPL (>= 2" with a missing closing parenthesis.
+_GPL_RANGE_REGEX = re.compile(r'^(GPL|LGPL|AGPL|GNU General Public License|'
+                              r'GNU Lesser General Public License)\s*'
+                              r'\(\s*(>=|>|==|<=)\s*(\d+)((?:\.\d+)*)\s*\)?$')
+
+_GPL_FAMILIES = {
+    'GPL': 'GPL',
+    'GNU General Public License': 'GPL',
+    'LGPL': 'LGPL',
+    'GNU Lesser General Public License': 'LGPL',
+    'AGPL': 'AGPL',
+}
+
+_GPL_VERSIONS = {
+    'GPL': ['1.0', '2.0', '3.0'],
+    'LGPL': ['2.0', '2.1', '3.0'],
+    'AGPL': ['1.0', '3.0'],
+}
+
+_CC_REGEX = re.compile(r'^CC BY((?:-(?:NC|ND|SA))*) (\d\.\d)$')
+
+
+def _normalize_gpl_range(range_match):
+  family = _GPL_FAMILIES[range_match.group(1)]
+  major_version = range_match.group(3)
+  minor_version = range_match.group(4)
+  # Versions like GPL (>= 2.15.1) or GPL (>= 3.3.2) are typos for the major
+  # version, but LGPL has a real 2.1 version.
+  version = f'{major_version}.0'
+  if family == 'LGPL' and major_version == '2' and minor_version == '.1':
+    version = '2.1'
+  if version not in _GPL_VERSIONS[family]:
+    return None
+  if range_match.group(2) in ('>=', '>'):
+    return f'{family}-{version}-or-later'
+  # GPL (<= 2) seems to be a typo for GPL (== 2).
+  return f'{family}-{version}-only'
+
+
+@functools.cache
+def normalize_license(license_text):
+  """Normalizes a single CRAN license string into an SPDX expression.
+
+  Exact matches are looked up in EXACT_LICENSES, after which a few pattern
+  rules are tried. Returns a NormalizedLicense with the rule that fired, or
+  with the license 'unrecognized' if none did.
+  """
+  license_text = ' '.join(license_text.split())
+  if license_text in EXACT_LICENSES:
+    return NormalizedLicense(EXACT_LICENSES[license_text], 'exact')
+
+  file_suffix_match = _FILE_SUFFIX_REGEX.match(license_text)
+  if file_suffix_match:
+    base_license = normalize_license(file_suffix_match.group(1))
+    if base_license.rule != 'unrecognized':
+      return NormalizedLicense(base_license.license,
+                               f'file-suffix+{base_license.rule}')
+
+  gpl_range_match = _GPL_RANGE_REGEX.match(license_text)
+  if gpl_range_match:
+    gpl_license = _normalize_gpl_range(gpl_range_match)
+    if gpl_license:
+      return NormalizedLicense(gpl_license, 'gpl-range')
+
+  cc_match = _CC_REGEX.match(license_text)
+  if cc_match:
+    return NormalizedLicense(f'CC-BY{cc_match.group(1)}-{cc_match.group(2)}',
+                             'creative-commons')
+
+  return NormalizedLicense('unrecognized', 'unrecognized')
+
+
+def canonicalize_license(license_text):
+  return normalize_license(license_text).license
+
+
+def canonicalize_license_expression(license_expression):
+  license_parts = license_expression.split('|')
+  canon_license_parts = [
+      canonicalize_license(license_part.strip())
+      for license_part in license_parts
+  ]
+  return ' OR '.join(canon_license_parts)
+
+
+def log_rule_counts(license_texts):
+  """Logs how many license strings each normalization rule handled."""
+  rule_counts = collections.Counter()
+  for license_text in license_texts:
+    for license_part in license_text.split('|'):
+      rule_counts[normalize_license(license_part.strip()).rule] += 1
+  for rule, rule_count in rule_counts.most_common():
+    logging.info(f'CRAN license rule {rule} matched {rule_count} times.')
+
+
+def load_r_licenses(r_licenses_file_path):
+  """Loads the CSV written by gather-r-licenses.R.
+
+  Returns a mapping from R package name to the canonicalized SPDX expression.
+  """
+  r_license_texts = {}
+
+  with open(r_licenses_file_path, newline='') as r_licenses_file:
+    r_licenses_reader = csv.reader(r_licenses_file)
+    # Skip the header row.
+    next(r_licenses_reader, None)
+    for package_name, _, license_text in r_licenses_reader:
+      r_license_texts[package_name] = license_text
+
+  log_rule_counts(r_license_texts.values())
+
+  return {
+      package_name: canonicalize_license_expression(license_text)
+      for package_name, license_text in r_license_texts.items()
+  }
+
+
+def read_dcf(dcf_file):
+  """Yields a dict of fields for each record in a Debian control file.
+
+  This is the format of the CRAN PACKAGES index. Continuation lines are folded
+  into the preceding field.
+  """
+  record = {}
+  last_field = None
+  for line in dcf_file:
+    line = line.rstrip('\n')
+    if not line.strip():
+      if record:
+        yield record
+      record = {}
+      last_field = None
+      continue
+    if line[0] in ' \t' and last_field:
+      record[last_field] += ' ' + line.strip()
+      continue
+    last_field, _, value = line.partition(':')
+    record[last_field] = value.strip()
+  if record:
+    yield record
+
+
+def find_packages_file(packages_path):
+  """Finds the PACKAGES index for a file or a (mirror) directory path."""
+  if not os.path.isdir(packages_path):
+    return packages_path
+  for candidate in [
+      'src/contrib/PACKAGES.gz', 'src/contrib/PACKAGES', 'PACKAGES.gz',
+      'PACKAGES'
+  ]:
+    candidate_path = os.path.join(packages_path, candidate)
+    if os.path.exists(candidate_path):
+      return candidate_path
+  raise FileNotFoundError(f'Could not find a PACKAGES file in {packages_path}')
+
+
+def load_packages_licenses(packages_path):
+  """Loads license information from a CRAN PACKAGES or PACKAGES.gz file.
+
+  packages_path can also be a directory containing one, such as the root of a
+  local CRAN mirror. Returns a mapping from R package name to the
+  canonicalized SPDX expression.
+  """
+  packages_file_path = find_packages_file(packages_path)
+  if packages_file_path.endswith('.gz'):
+    packages_file = gzip.open(packages_file_path, 'rt', encoding='utf-8')
+  else:
+    packages_file = open(packages_file_path, encoding='utf-8')
+
+  r_license_texts = {}
+  with packages_file:
+    for record in read_dcf(packages_file):
+      if 'Package' in record and 'License' in record:
+        r_license_texts[record['Package']] = record['License']
+
+  log_rule_counts(r_license_texts.values())
+
+  return {
+      package_name: canonicalize_license_expression(license_text)
+      for package_name, license_text in r_license_texts.items()
+  }
+
+
+def get_package_licenses(package_names,
+                         r_package_licenses,
+                         resolved_names=None):
+  """Returns a mapping from spack package name to license for r- packages.
+
+  resolved_names optionally maps package names to (CRAN name, score), as
+  returned by names.resolve_names, for packages named differently on CRAN.
+  """
+  package_licenses = {}
+  for package_name in package_names:
+    if not package_name.startswith('r-'):
+      continue
+    r_package_name = package_name[2:]
+    if resolved_names and package_name in resolved_names:
+      r_package_name, _ = resolved_names[package_name]
+    if r_package_name in r_package_licenses:
+      package_licenses[package_name] = r_package_licenses[r_package_name]
+  return package_licenses
@@ -0,0 +1,107 @@
+"""Backends that spack_stage runs its staging and detection tasks on.
+
+Ray spreads the work over a cluster, while the process and thread backends
+run it on the local machine with concurrent.futures and start instantly. All
+of them go through the same small interface: submit_stage and submit_detect
+return futures, wait returns the futures that have finished and result
+returns the node a task ran on along with the task's return value.
+"""
+
+import concurrent.futures
+import os
+
+EXECUTORS = ['ray', 'process', 'thread']
+DEFAULT_EXECUTOR = 'ray'
+
+
+def _run_local(function, *args):
+  return None, function(*args)
+
+
+def _run_on_node(function, *args):
+  import ray
+  return ray.get_runtime_context().get_node_id(), function(*args)
+
+
+class PoolExecutor:
+  """Runs tasks on local concurrent.futures pools, one per stage."""
+
+  def __init__(self, pool_class, download_concurrency, detect_workers):
+    self.detect_workers = detect_workers or os.cpu_count()
+    self._stage_pool = pool_class(download_concurrency)
+    self._detect_pool = pool_class(self.detect_workers)
+
+  def submit_stage(self, function, *args):
+    return self._stage_pool.submit(_run_local, function, *args)
+
+  def submit_detect(self, node_id, function, *args):
+    return self._detect_pool.submit(_run_local, function, *args)
+
+  def wait(self, futures, timeout):
+    finished, _ = concurrent.futures.wait(
+        futures,
+        timeout=timeout,
+        return_when=concurrent.futures.FIRST_COMPLETED)
+    return finished
+
+  def result(self, future):
+    return future.result()
+
+  def shutdown(self):
+    self._stage_pool.shutdown()
+    self._detect_pool.shutdown()
+
+
+class RayExecutor:
+  """Runs tasks on a Ray cluster.
+
+  Staging is bound by the network and disk rather than CPU, so staging tasks
+  don't reserve a core and their concurrency is left to the caller. Detection
+  tasks are pinned to the node that was given, which should be the one that
+  staged the source.
+  """
+
+  def __init__(self, detect_workers):
+    import ray
+    from ray.util.scheduling_strategies import NodeAffinitySchedulingStrategy
+
+    if not ray.is_initialized():
+      ray.init()
+    self._ray = ray
+    self._node_affinity = NodeAffinitySchedulingStrategy
+    self._stage_remote = ray.remote(num_cpus=0)(_run_on_node)
+    self._detect_remote = ray.remote(num_cpus=1)(_run_on_node)
+    self.detect_workers = detect_workers or int(ray.cluster_resources().get(
+        'CPU', os.cpu_count()))
+
+  def submit_stage(self, function, *args):
+    return self._stage_remote.remote(function, *args)
+
+  def submit_detect(self, node_id, function, *args):
+    return self._detect_remote.options(
+        scheduling_strategy=self._node_affinity(node_id, soft=False)).remote(
+            function, *args)
+
+  def wait(self, futures, timeout):
+    finished, _ = self._ray.wait(list(futures), num_returns=1, timeout=timeout)
+    return finished
+
+  def result(self, future):
+    return self._ray.get(future)
+
+  def shutdown(self):
+    pass
+
+
+def get_executor(executor_name, download_concurrency, detect_workers=None):
+  """Creates the named executor. detect_workers defaults to the CPU count."""
+  if executor_name == 'ray':
+    return RayExecutor(detect_workers)
+  if executor_name == 'process':
+    return PoolExecutor(concurrent.futures.ProcessPoolExecutor,
+                        download_concurrency, detect_workers)
+  if executor_name == 'thread':
+    return PoolExecutor(concurrent.futures.ThreadPoolExecutor,
+                        download_concurrency, detect_workers)
+  raise ValueError(f'Unknown executor {executor_name}, expected one of '
+                   f'{EXECUTORS}.')
@@ -0,0 +1,90 @@
+"""Timings of previous detection runs, for scheduling the next one.
+
+A few huge packages dominate the tail of a run if they happen to be started
+last. Recording how long each package took to stage and detect lets the next
+run start the longest packages first.
+"""
+
+import heapq
+import json
+import statistics
+
+from spack_license_utils import utils
+
+# Estimates for packages that have never been seen, if there is no history
+# at all to take a typical package from.
+DEFAULT_STAGE_SECONDS = 60.0
+DEFAULT_DETECT_SECONDS = 30.0
+
+# How much a new measurement moves the estimate for a package.
+_SMOOTHING = 0.5
+
+
+class StageHistory:
+  """Per package stage and detect durations and staged source sizes.
+
+  Entries are keyed by package name rather than version, so a new version of
+  a package is estimated from the versions before it.
+  """
+
+  def __init__(self, history_path):
+    self.history_path = history_path
+    try:
+      with open(history_path) as history_file:
+        self.entries = json.load(history_file)
+    except FileNotFoundError:
+      self.entries = {}
+    self._default_estimate = None
+
+  def _update(self, package_name, field, value):
+    entry = self.entries.setdefault(package_name, {})
+    if field in entry and field != 'source_bytes':
+      value = (1 - _SMOOTHING) * entry[field] + _SMOOTHING * value
+    entry[field] = value
+
+  def record_stage(self, package_name, stage_seconds, source_bytes):
+    self._update(package_name, 'stage_seconds', stage_seconds)
+    self._update(package_name, 'source_bytes', source_bytes)
+
+  def record_detect(self, package_name, detect_seconds):
+    self._update(package_name, 'detect_seconds', detect_seconds)
+
+  def _get_median(self, field, default):
+    values = [entry[field] for entry in self.entries.values() if field in entry]
+    return statistics.median(values) if values else default
+
+  def _get_default_estimate(self):
+    if self._default_estimate is None:
+      self._default_estimate = (self._get_median('stage_seconds',
+                                                 DEFAULT_STAGE_SECONDS),
+                                self._get_median('detect_seconds',
+                                                 DEFAULT_DETECT_SECONDS))
+    return self._default_estimate
+
+  def estimate(self, package_name):
+    """Returns the expected (stage seconds, detect seconds) for a package.
+
+    Packages without history get the median of the packages that have it.
+    """
+    default_stage_seconds, default_detect_seconds = self._get_default_estimate()
+    entry = self.entries.get(package_name, {})
+    return (entry.get('stage_seconds', default_stage_seconds),
+            entry.get('detect_seconds', default_detect_seconds))
+
+  def sort_longest_first(self, package_names):
+    return sorted(
+        package_names,
+        key=lambda package_name: sum(self.estimate(package_name)),
+        reverse=True)
+
+  def save(self):
+    with utils.atomic_write(self.history_path) as history_file:
+      json.dump(self.entries, history_file, indent=1, sort_keys=True)
+
+
+def predict_makespan(durations, workers):
+  """Returns how long durations take on workers, started longest first."""
+  worker_finish_times = [0.0] * max(1, min(workers, len(durations)))
+  for duration in sorted(durations, reverse=True):
+    heapq.heapreplace(worker_finish_times, worker_finish_times[0] + duration)
+  return max(worker_finish_times)
@@ -0,0 +1,117 @@
+"""A persistent cache for HTTP responses backed by SQLite.
+"""
+
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class ResponseCache:
+  """Caches response bodies along with their ETag/Last-Modified validators.
+
+  Cached responses younger than the TTL are served without touching the
+  network. Older ones are revalidated with a conditional request. In offline
+  mode only cached responses are served, however old they are.
+  """
+
+  def __init__(self, cache_path, ttl=DEFAULT_TTL, offline=False):
+    self.ttl = ttl
+    self.offline = offline
+    self._lock = threading.Lock()
+    self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+    self._connection.execute('PRAGMA journal_mode=WAL')
+    self._connection.execute('PRAGMA synchronous=NORMAL')
+    self._connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                             'url TEXT PRIMARY KEY, '
+                             'body BLOB NOT NULL, '
+                             'etag TEXT, '
+                             'last_modified TEXT, '
+                             'fetched_at REAL NOT NULL, '
+                             'accessed_at REAL NOT NULL, '
+                             'size INTEGER NOT NULL)')
+    self._connection.commit()
+
+  def _lookup(self, url):
+    with self._lock:
+      return self._connection.execute(
+          'SELECT body, etag, last_modified, fetched_at FROM responses '
+          'WHERE url = ?', (url,)).fetchone()
+
+  def _store(self, url, body, etag, last_modified):
+    now = time.time()
+    with self._lock:
+      self._connection.execute(
+          'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+          (url, body, etag, last_modified, now, now, len(body)))
+      self._connection.commit()
+
+  def _touch(self, url, refreshed):
+    now = time.time()
+    with self._lock:
+      if refreshed:
+        self._connection.execute(
+            'UPDATE responses SET fetched_at = ?, accessed_at = ? '
+            'WHERE url = ?', (now, now, url))
+      else:
+        self._connection.execute(
+            'UPDATE responses SET accessed_at = ? WHERE url = ?', (now, url))
+      self._connection.commit()
+
+  def get(self, session, url, headers=None):
+    """Returns the body of a successful response for url, or None.
+
+    Only successful responses are cached.
+    """
+    cached_response = self._lookup(url)
+    if cached_response is not None:
+      body, etag, last_modified, fetched_at = cached_response
+      if self.offline or time.time() - fetched_at < self.ttl:
+        self._touch(url, False)
+        return body
+    elif self.offline:
+      return None
+
+    request_headers = dict(headers or {})
+    if cached_response is not None:
+      if etag:
+        request_headers['If-None-Match'] = etag
+      if last_modified:
+        request_headers['If-Modified-Since'] = last_modified
+
+    response = session.get(url, headers=request_headers)
+    if response.status_code == 304 and cached_response is not None:
+      self._touch(url, True)
+      return body
+    if response.status_code != 200:
+      return None
+    self._store(url, response.content, response.headers.get('ETag'),
+                response.headers.get('Last-Modified'))
+    return response.content
+
+  def evict(self, max_age=DEFAULT_MAX_AGE, max_bytes=DEFAULT_MAX_BYTES):
+    """Drops old responses, then the least recently used until under max_bytes.
+    """
+    with self._lock:
+      self._connection.execute('DELETE FROM responses WHERE fetched_at < ?',
+                               (time.time() - max_age,))
+      total_size = self._connection.execute(
+          'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+      if total_size > max_bytes:
+        evicted_urls = []
+        for url, size in self._connection.execute(
+            'SELECT url, size FROM responses ORDER BY accessed_at'):
+          if total_size <= max_bytes:
+            break
+          evicted_urls.append((url,))
+          total_size -= size
+        self._connection.executemany('DELETE FROM responses WHERE url = ?',
+                                     evicted_urls)
+      self._connection.commit()
+
+  def close(self):
+    with self._lock:
+      self._connection.close()
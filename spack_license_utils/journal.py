@@ -0,0 +1,92 @@
+"""An append-only JSONL journal of license detection results.
+
+Every finished package is appended as soon as it is known, so an interrupted
+run loses at most the last few results. Syncing each line to disk would slow
+down large runs, so the journal is fsynced in batches of records or after an
+interval, whichever comes first.
+"""
+
+import json
+import logging
+import os
+import time
+
+DEFAULT_SYNC_EVERY = 32
+DEFAULT_SYNC_INTERVAL = 5.0
+
+
+class Journal:
+  """Appends (package name, license) results to a JSONL file.
+
+  Opening a journal with resume set keeps the results already in it,
+  otherwise the journal is started over.
+  """
+
+  def __init__(self,
+               journal_path,
+               resume=False,
+               sync_every=DEFAULT_SYNC_EVERY,
+               sync_interval=DEFAULT_SYNC_INTERVAL):
+    self.journal_path = journal_path
+    self.sync_every = sync_every
+    self.sync_interval = sync_interval
+    self._journal_file = open(journal_path, 'a' if resume else 'w')
+    # Don't glue the first new entry onto a line left partly written.
+    if self._journal_file.tell() > 0:
+      with open(journal_path, 'rb') as journal_file:
+        journal_file.seek(-1, os.SEEK_END)
+        if journal_file.read(1) != b'\n':
+          self._journal_file.write('\n')
+    self._unsynced_count = 0
+    self._last_sync_time = time.monotonic()
+
+  def append(self, package_name, license_string):
+    self._journal_file.write(
+        json.dumps({
+            'name': package_name,
+            'license': license_string,
+            'time': time.time(),
+        }) + '\n')
+    self._unsynced_count += 1
+    if (self._unsynced_count >= self.sync_every or
+        time.monotonic() - self._last_sync_time >= self.sync_interval):
+      self.sync()
+
+  def sync(self):
+    self._journal_file.flush()
+    os.fsync(self._journal_file.fileno())
+    self._unsynced_count = 0
+    self._last_sync_time = time.monotonic()
+
+  def close(self):
+    self.sync()
+    self._journal_file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+def read_journal(journal_path):
+  """Returns a mapping from package name to license from a journal.
+
+  Later entries for a package win. A missing journal reads as empty, and a
+  line that was only partly written when a run died is skipped.
+  """
+  journal_entries = {}
+  try:
+    journal_file = open(journal_path)
+  except FileNotFoundError:
+    return journal_entries
+  with journal_file:
+    for line_number, line in enumerate(journal_file, 1):
+      try:
+        entry = json.loads(line)
+      except ValueError:
+        logging.warning(
+            f'Skipping unreadable line {line_number} of {journal_path}')
+        continue
+      journal_entries[entry['name']] = entry['license']
+  return journal_entries
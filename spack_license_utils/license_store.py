@@ -0,0 +1,190 @@
+"""Package license records in SQLite, as an alternative to the license CSV.
+
+Rewriting the whole CSV to change a few rows gets slow as the package list
+grows, and only one script can safely write it at a time. The store keeps
+one indexed row per package in a WAL mode database, so readers don't block
+writers, and writers only touch the rows they change in short transactions.
+The CSV format can still be imported and exported.
+"""
+
+import contextlib
+import datetime
+import sqlite3
+import threading
+
+from spack_license_utils import utils
+
+# How long a writer waits for another one to commit before giving up.
+DEFAULT_TIMEOUT = 60
+
+DEFAULT_BATCH_SIZE = 1000
+
+_COLUMNS = 'package, license, source, confidence, updated_at'
+
+
+def _get_timestamp():
+  return datetime.datetime.now(
+      datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+def _get_prefix_range(prefix):
+  # Package names starting with prefix sort between these, which lets the
+  # primary key index answer prefix queries.
+  return prefix, prefix + '\U0010ffff'
+
+
+class LicenseStore:
+  """A SQLite database of LicenseRecords, keyed by package name.
+
+  Writes are batched into transactions of batch_size rows. Every write
+  begins its transaction immediately, so concurrent writers queue up on the
+  lock rather than failing to upgrade a read. Rows are stamped with the UTC
+  time they were written in updated_at.
+  """
+
+  def __init__(self,
+               store_path,
+               timeout=DEFAULT_TIMEOUT,
+               batch_size=DEFAULT_BATCH_SIZE):
+    self.batch_size = batch_size
+    self._lock = threading.Lock()
+    self._connection = sqlite3.connect(
+        store_path,
+        timeout=timeout,
+        isolation_level=None,
+        check_same_thread=False)
+    self._connection.execute('PRAGMA journal_mode=WAL')
+    self._connection.execute('PRAGMA synchronous=NORMAL')
+    with self._transaction():
+      self._connection.execute('CREATE TABLE IF NOT EXISTS licenses ('
+                               'package TEXT PRIMARY KEY, '
+                               'license TEXT NOT NULL, '
+                               'source TEXT NOT NULL, '
+                               'confidence REAL, '
+                               'updated_at TEXT)')
+      for column in ['license', 'source', 'confidence', 'updated_at']:
+        self._connection.execute(
+            f'CREATE INDEX IF NOT EXISTS licenses_{column} '
+            f'ON licenses ({column})')
+
+  @contextlib.contextmanager
+  def _transaction(self):
+    with self._lock:
+      self._connection.execute('BEGIN IMMEDIATE')
+      try:
+        yield
+      except BaseException:
+        self._connection.execute('ROLLBACK')
+        raise
+      self._connection.execute('COMMIT')
+
+  def _execute_batches(self, statement, parameters):
+    """Runs statement for each parameter tuple, batch_size per transaction.
+
+    Returns the number of rows that were changed.
+    """
+    changed_count = 0
+    parameters = iter(parameters)
+    while True:
+      batch = [
+          parameter for _, parameter in zip(range(self.batch_size), parameters)
+      ]
+      if not batch:
+        return changed_count
+      with self._transaction():
+        changed_count += self._connection.executemany(statement, batch).rowcount
+
+  def __len__(self):
+    with self._lock:
+      return self._connection.execute(
+          'SELECT COUNT(*) FROM licenses').fetchone()[0]
+
+  def upsert(self, package_licenses):
+    """Inserts LicenseRecords, replacing the rows of packages already stored.
+
+    Returns the number of records written.
+    """
+    updated_at = _get_timestamp()
+    return self._execute_batches(
+        f'INSERT INTO licenses ({_COLUMNS}) VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT (package) DO UPDATE SET license = excluded.license, '
+        'source = excluded.source, confidence = excluded.confidence, '
+        'updated_at = excluded.updated_at',
+        ((package_license.name, package_license.license, package_license.source,
+          package_license.confidence, updated_at)
+         for package_license in package_licenses))
+
+  def apply_licenses(self, licenses, source, confidences=None):
+    """Fills in licenses from a name to license mapping for UNKNOWN packages.
+
+    The store analogue of utils.apply_package_licenses. A package another
+    writer has filled in since is left alone. Returns the number of packages
+    that were updated.
+    """
+    confidences = confidences or {}
+    updated_at = _get_timestamp()
+    return self._execute_batches(
+        'UPDATE licenses SET license = ?, source = ?, confidence = ?, '
+        "updated_at = ? WHERE package = ? AND license = 'UNKNOWN'",
+        ((license, source, confidences.get(package_name), updated_at,
+          package_name) for package_name, license in licenses.items()))
+
+  def get_records(self, license=None, source=None, prefix=''):
+    """Yields the LicenseRecords matching all the given filters, by name."""
+    conditions = ['package >= ? AND package < ?']
+    parameters = list(_get_prefix_range(prefix))
+    if license is not None:
+      conditions.append('license = ?')
+      parameters.append(license)
+    if source is not None:
+      conditions.append('source = ?')
+      parameters.append(source)
+    with self._lock:
+      rows = self._connection.execute(
+          f'SELECT {_COLUMNS} FROM licenses WHERE {" AND ".join(conditions)} '
+          'ORDER BY package', parameters).fetchall()
+    for row in rows:
+      yield utils.LicenseRecord(*row)
+
+  def get_unknown_package_names(self, prefix=''):
+    """Returns the names of packages with prefix that have no license yet."""
+    return [
+        package_license.name
+        for package_license in self.get_records('UNKNOWN', prefix=prefix)
+    ]
+
+  def import_csv(self, license_csv_path):
+    """Imports the rows of a license CSV, like the get-packages.py output.
+
+    Packages missing from the store are inserted, keeping the timestamp of
+    the row if it has one. A stored package is only replaced when its
+    license changed and either the stored or the new license comes from
+    Spack, so licenses found by the other sources survive re-importing the
+    package list. Returns the number of packages inserted or replaced.
+    """
+    updated_at = _get_timestamp()
+    return self._execute_batches(
+        f'INSERT INTO licenses ({_COLUMNS}) VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT (package) DO UPDATE SET license = excluded.license, '
+        'source = excluded.source, confidence = excluded.confidence, '
+        "updated_at = ? WHERE (licenses.source = 'Spack' OR "
+        "excluded.source = 'Spack') AND (licenses.license != excluded.license "
+        'OR licenses.source != excluded.source)',
+        ((package_license.name, package_license.license, package_license.source,
+          package_license.confidence, package_license.updated_at or
+          updated_at, updated_at)
+         for package_license in utils.read_license_csv(license_csv_path)))
+
+  def export_csv(self, license_csv_path):
+    """Writes every record to a license CSV, sorted by package name."""
+    utils.write_license_csv(license_csv_path, self.get_records())
+
+  def close(self):
+    with self._lock:
+      self._connection.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
@@ -0,0 +1,189 @@
+"""Matches license files against SPDX license texts without leaving Python.
+
+Most packages ship a verbatim copy of a standard license in a top level
+LICENSE or COPYING file, which can be recognized much faster than running the
+license detector over the whole source tree. License texts are normalized
+into a sequence of words, and matched first by the hash of that sequence and
+then by the similarity of their word sets.
+
+The texts come from a local directory with one <license ID>.txt file per
+license, like the text directory of the SPDX license-list-data repository.
+The fingerprints built from it are stored in a marshal snapshot next to the
+directory and rebuilt whenever the directory changes.
+"""
+
+import bisect
+import functools
+import hashlib
+import os
+import re
+
+from spack_license_utils import snapshot
+
+SNAPSHOT_VERSION = 1
+
+# Files larger than this are not plain license texts.
+MAX_LICENSE_FILE_BYTES = 256 * 1024
+
+# The license files that should hold nothing but a license text. NOTICE and
+# COPYRIGHT files usually hold attributions instead, so they are not matched.
+LICENSE_TEXT_PREFIXES = ('license', 'licence', 'copying', 'unlicense')
+
+_COPYRIGHT_LINE_RE = re.compile(r'^\W*(copyright|\(c\)|©).*$',
+                                re.IGNORECASE | re.MULTILINE)
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+# Spelling variants that the SPDX matching guidelines treat as equivalent.
+_EQUIVALENT_WORDS = {
+    'licence': 'license',
+    'licences': 'licenses',
+    'sublicence': 'sublicense',
+}
+
+
+def get_words(license_text):
+  """Normalizes a license text into a list of lowercase words.
+
+  Copyright notices, punctuation and whitespace differ between copies of the
+  same license, so they are dropped.
+  """
+  license_text = _COPYRIGHT_LINE_RE.sub('', license_text.lower())
+  return [
+      _EQUIVALENT_WORDS.get(word, word)
+      for word in _WORD_RE.findall(license_text)
+  ]
+
+
+def get_fingerprint(words):
+  return hashlib.sha256(' '.join(words).encode('utf-8')).hexdigest()
+
+
+class LicenseIndex:
+  """Fingerprints of license texts, searchable by hash and word set.
+
+  Word sets are kept sorted by size, since two sets can only be as similar
+  as the ratio of their sizes, which limits the texts that need comparing.
+  """
+
+  def __init__(self, fingerprints, word_sets):
+    self.fingerprints = fingerprints
+    self.word_sets = sorted(word_sets, key=lambda entry: len(entry[1]))
+    self._sizes = [len(word_set) for _, word_set in self.word_sets]
+
+  def __len__(self):
+    return len(self.word_sets)
+
+  def match(self, license_text, threshold):
+    """Returns (license ID, confidence) for the closest license text.
+
+    The confidence is 1.0 for an exact match and otherwise the Jaccard
+    similarity of the word sets. Texts that equally match several licenses
+    (like GPL-2.0-only and GPL-2.0-or-later) or that don't reach threshold
+    give (None, confidence).
+    """
+    words = get_words(license_text)
+    if not words:
+      return None, 0.0
+
+    exact_license_ids = self.fingerprints.get(get_fingerprint(words), [])
+    if len(exact_license_ids) == 1:
+      return exact_license_ids[0], 1.0
+    if exact_license_ids:
+      return None, 1.0
+
+    word_set = frozenset(words)
+    best_license_ids = []
+    best_similarity = 0.0
+    start = bisect.bisect_left(self._sizes, len(word_set) * threshold)
+    end = bisect.bisect_right(self._sizes, len(word_set) / threshold)
+    for license_id, license_word_set in self.word_sets[start:end]:
+      shared_count = len(word_set & license_word_set)
+      similarity = shared_count / (
+          len(word_set) + len(license_word_set) - shared_count)
+      if similarity > best_similarity:
+        best_license_ids = [license_id]
+        best_similarity = similarity
+      elif similarity == best_similarity:
+        best_license_ids.append(license_id)
+
+    if best_similarity < threshold or len(best_license_ids) != 1:
+      return None, best_similarity
+    return best_license_ids[0], best_similarity
+
+
+def _get_text_paths(license_texts_dir):
+  text_paths = {}
+  for dir_entry in os.scandir(license_texts_dir):
+    license_id, extension = os.path.splitext(dir_entry.name)
+    # Deprecated IDs and exceptions aren't licenses a file can be matched to.
+    if (extension != '.txt' or license_id.startswith('deprecated_') or
+        'exception' in license_id.lower()):
+      continue
+    text_paths[license_id] = dir_entry.path
+  return text_paths
+
+
+def _compile(text_paths):
+  fingerprints = {}
+  word_sets = []
+  for license_id, text_path in sorted(text_paths.items()):
+    with open(text_path, encoding='utf-8', errors='replace') as text_file:
+      words = get_words(text_file.read())
+    if not words:
+      continue
+    fingerprints.setdefault(get_fingerprint(words), []).append(license_id)
+    word_sets.append((license_id, frozenset(words)))
+  return fingerprints, word_sets
+
+
+@functools.cache
+def load_index(license_texts_dir):
+  """Loads the index for a directory of SPDX license texts.
+
+  Indexes are cached per process, and compiled snapshots are stored in
+  license_texts_dir + '.fingerprints'.
+  """
+  license_texts_dir = os.path.normpath(license_texts_dir)
+  text_paths = _get_text_paths(license_texts_dir)
+  source_signature = tuple(
+      (license_id, os.stat(text_path).st_mtime_ns)
+      for license_id, text_path in sorted(text_paths.items()))
+  index_fields = snapshot.load_snapshot(f'{license_texts_dir}.fingerprints',
+                                        SNAPSHOT_VERSION, source_signature,
+                                        lambda: _compile(text_paths))
+  return LicenseIndex(*index_fields)
+
+
+def match_license_files(source_dir, license_index, threshold):
+  """Matches the license files at the top level of a source tree.
+
+  Returns (license ID, confidence). If no license file matches, or the files
+  match different licenses, returns ('NOASSERTION', confidence) so the
+  caller can fall back to a full scan.
+  """
+  try:
+    dir_entries = list(os.scandir(source_dir))
+  except OSError:
+    return 'NOASSERTION', 0.0
+
+  matched_license_ids = set()
+  lowest_confidence = 1.0
+  for dir_entry in dir_entries:
+    if not dir_entry.name.lower().startswith(LICENSE_TEXT_PREFIXES):
+      continue
+    if not dir_entry.is_file():
+      continue
+    if dir_entry.stat().st_size > MAX_LICENSE_FILE_BYTES:
+      return 'NOASSERTION', 0.0
+    with open(
+        dir_entry.path, encoding='utf-8', errors='replace') as license_file:
+      license_id, confidence = license_index.match(license_file.read(),
+                                                   threshold)
+    if license_id is None:
+      return 'NOASSERTION', confidence
+    matched_license_ids.add(license_id)
+    lowest_confidence = min(lowest_confidence, confidence)
+
+  if len(matched_license_ids) != 1:
+    return 'NOASSERTION', 0.0
+  return matched_license_ids.pop(), lowest_confidence
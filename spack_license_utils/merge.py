@@ -0,0 +1,133 @@
+"""Merges license CSVs from several sources into one answer per package.
+
+Rows for the same package from all inputs are grouped together and a policy
+picks one license out of the candidates, remembering the others and whether
+they disagreed. Inputs sorted by package name (as get-packages.py writes
+them) are merged as a stream, so memory use doesn't grow with the number of
+packages. Unsorted inputs are grouped in memory instead.
+"""
+
+import collections
+import heapq
+import itertools
+
+from spack_license_utils import utils
+
+# The order the sources have traditionally been applied in, which is the
+# order their licenses take precedence in.
+DEFAULT_PRIORITY = ['Spack', 'Alpine', 'Cran', 'Pypi', 'Detected']
+
+POLICIES = ['priority', 'confidence']
+
+MergeResult = collections.namedtuple('MergeResult',
+                                     ['record', 'candidates', 'conflict'])
+
+
+class MergePolicy:
+  """Picks a license for a package out of the candidates from each source.
+
+  The priority policy prefers sources earlier in priority, breaking ties by
+  confidence. The confidence policy prefers the most confident candidate,
+  breaking ties by priority. Sources missing from priority rank after the
+  listed ones, and candidates without a confidence count as fully confident.
+  Candidates below min_confidence are ignored.
+  """
+
+  def __init__(self,
+               priority=DEFAULT_PRIORITY,
+               policy='priority',
+               min_confidence=None):
+    if policy not in POLICIES:
+      raise ValueError(f'Unknown policy {policy}, expected one of {POLICIES}.')
+    self.source_ranks = {source: rank for rank, source in enumerate(priority)}
+    self.policy = policy
+    self.min_confidence = min_confidence
+
+  def _get_confidence(self, record):
+    return 1.0 if record.confidence is None else record.confidence
+
+  def _get_sort_key(self, record):
+    source_rank = self.source_ranks.get(record.source, len(self.source_ranks))
+    if self.policy == 'priority':
+      return source_rank, -self._get_confidence(record)
+    return -self._get_confidence(record), source_rank
+
+  def get_candidates(self, records):
+    """Returns the records with a usable license, best first."""
+    candidates = []
+    seen_candidates = set()
+    for record in records:
+      if record.license == 'UNKNOWN':
+        continue
+      if (self.min_confidence is not None and
+          self._get_confidence(record) < self.min_confidence):
+        continue
+      if (record.source, record.license) in seen_candidates:
+        continue
+      seen_candidates.add((record.source, record.license))
+      candidates.append(record)
+    candidates.sort(key=self._get_sort_key)
+    return candidates
+
+  def merge(self, package_name, records):
+    candidates = self.get_candidates(records)
+    if not candidates:
+      return MergeResult(
+          utils.LicenseRecord(package_name, 'UNKNOWN', 'NONE'), [], False)
+    chosen = candidates[0]
+    conflict = len({candidate.license for candidate in candidates}) > 1
+    return MergeResult(
+        utils.LicenseRecord(package_name, chosen.license, chosen.source,
+                            chosen.confidence, chosen.updated_at), candidates,
+        conflict)
+
+
+def is_sorted(license_csv_path):
+  """Returns whether a license CSV is sorted by package name."""
+  previous_name = None
+  for record in utils.read_license_csv(license_csv_path):
+    if previous_name is not None and record.name < previous_name:
+      return False
+    previous_name = record.name
+  return True
+
+
+def group_sorted(license_csv_paths):
+  """Yields (package name, records) from license CSVs sorted by name.
+
+  The inputs are merged as streams, holding one package at a time.
+  """
+  merged_records = heapq.merge(
+      *(utils.read_license_csv(license_csv_path)
+        for license_csv_path in license_csv_paths),
+      key=lambda record: record.name)
+  for package_name, records in itertools.groupby(
+      merged_records, key=lambda record: record.name):
+    yield package_name, list(records)
+
+
+def group_unsorted(license_csv_paths):
+  """Yields (package name, records) from license CSVs in any order.
+
+  All records are grouped in memory, and yielded sorted by package name.
+  """
+  package_records = {}
+  for license_csv_path in license_csv_paths:
+    for record in utils.read_license_csv(license_csv_path):
+      package_records.setdefault(record.name, []).append(record)
+  for package_name in sorted(package_records):
+    yield package_name, package_records[package_name]
+
+
+def merge_license_csvs(license_csv_paths, merge_policy):
+  """Yields a MergeResult per package from several license CSVs.
+
+  The inputs are streamed if they are all sorted by package name, and
+  grouped in memory otherwise. Either way results come sorted by name.
+  """
+  if all(is_sorted(license_csv_path) for license_csv_path in license_csv_paths):
+    package_groups = group_sorted(license_csv_paths)
+  else:
+    package_groups = group_unsorted(license_csv_paths)
+  for package_name, records in package_groups:
+    yield merge_policy.merge(package_name, records)
@@ -0,0 +1,213 @@
+"""Resolves spack package names to the names other package repositories use.
+
+Spack and the upstream repositories often spell the same package slightly
+differently: py-foo in spack is py3-foo in aports, libfoo may just be foo,
+and CRAN and PyPI names mix case, dots and underscores. Names are reduced to
+a key that drops these differences, and keys are indexed by their character
+trigrams so near misses can be found without comparing against every
+upstream name.
+
+Only names with the same key are resolved automatically. Near misses are
+as likely to be a sibling package (py-sphinxcontrib-bar for
+py-sphinxcontrib-baz) as the same one, so they are only reported.
+"""
+
+import array
+import bisect
+import logging
+import math
+import re
+
+# The score of an upstream name whose key equals the key of the spack name,
+# but that isn't spelled the same.
+KEY_MATCH_SCORE = 0.95
+
+# Trigram similarities are scaled by this, so that a near miss always ranks
+# below a key match.
+NGRAM_MATCH_WEIGHT = 0.9
+
+DEFAULT_THRESHOLD = 0.8
+
+NGRAM_SIZE = 3
+
+# Language prefixes that repositories spell differently, and the spelling
+# they are keyed by.
+_LANGUAGE_PREFIXES = {
+    'py': 'py',
+    'py3': 'py',
+    'python': 'py',
+    'python3': 'py',
+    'r': 'r',
+    'perl': 'perl',
+    'lua': 'lua',
+    'ruby': 'ruby',
+    'rb': 'ruby',
+    'go': 'go',
+    'golang': 'go',
+    'rust': 'rust',
+}
+
+# Suffixes of split packages, which carry the same license as the main one.
+_SPLIT_SUFFIXES = ('dev', 'devel', 'libs', 'static')
+
+_SEPARATORS_RE = re.compile(r'[-_.]+')
+
+
+def normalize_name(package_name):
+  """Lowercases a name and collapses runs of -, _ and . into a single -."""
+  return _SEPARATORS_RE.sub('-', package_name).lower().strip('-')
+
+
+def get_name_key(package_name):
+  """Reduces a name to the part that identifies the package.
+
+  Language prefixes are unified, lib prefixes and split package suffixes
+  are dropped, and separators are removed.
+  """
+  name_parts = normalize_name(package_name).split('-')
+  language = ''
+  if len(name_parts) > 1 and name_parts[0] in _LANGUAGE_PREFIXES:
+    language = _LANGUAGE_PREFIXES[name_parts.pop(0)] + ':'
+  if len(name_parts) > 1 and name_parts[-1] in _SPLIT_SUFFIXES:
+    name_parts.pop()
+  name_key = ''.join(name_parts)
+  if name_key.startswith('lib') and len(name_key) > 3:
+    name_key = name_key[3:]
+  return language + name_key
+
+
+def get_ngrams(name_key):
+  padded_key = f' {name_key} '
+  return {
+      padded_key[index:index + NGRAM_SIZE]
+      for index in range(len(padded_key) - NGRAM_SIZE + 1)
+  }
+
+
+class NameIndex:
+  """An index of upstream package names, searchable by key and trigrams.
+
+  Keys are numbered in order of their trigram count, so each posting list is
+  sorted by trigram count too. Two keys can only be as similar as the ratio
+  of their trigram counts, which bounds the slice of each posting list that
+  needs looking at, and only the postings of the rarest trigrams of a name
+  are needed to find every key that could be similar enough.
+  """
+
+  def __init__(self, upstream_names):
+    self._key_names = {}
+    for upstream_name in upstream_names:
+      self._key_names.setdefault(get_name_key(upstream_name),
+                                 []).append(upstream_name)
+
+    self._keys = []
+    self._ngram_counts = array.array('I')
+    self._postings = {}
+    for name_key, ngrams in sorted(
+        ((name_key, get_ngrams(name_key)) for name_key in self._key_names),
+        key=lambda entry: len(entry[1])):
+      key_id = len(self._keys)
+      self._keys.append(name_key)
+      self._ngram_counts.append(len(ngrams))
+      for ngram in ngrams:
+        self._postings.setdefault(ngram, array.array('I')).append(key_id)
+
+  def __len__(self):
+    return len(self._key_names)
+
+  def lookup(self, package_name, limit=5, threshold=DEFAULT_THRESHOLD):
+    """Returns up to limit (upstream name, score) pairs, best first.
+
+    A name spelled the same scores 1.0, one with the same key scores
+    KEY_MATCH_SCORE and other names score by the Dice coefficient of their
+    key trigrams, scaled by NGRAM_MATCH_WEIGHT. Scores below threshold are
+    left out.
+    """
+    normalized_name = normalize_name(package_name)
+    name_key = get_name_key(package_name)
+    scores = {}
+    for upstream_name in self._key_names.get(name_key, []):
+      if normalize_name(upstream_name) == normalized_name:
+        scores[upstream_name] = 1.0
+      elif KEY_MATCH_SCORE >= threshold:
+        scores[upstream_name] = KEY_MATCH_SCORE
+
+    ngrams = get_ngrams(name_key)
+    min_similarity = threshold / NGRAM_MATCH_WEIGHT
+    if 0 < min_similarity <= 1:
+      min_ngram_count = math.ceil(
+          len(ngrams) * min_similarity / (2 - min_similarity))
+      max_ngram_count = math.floor(
+          len(ngrams) * (2 - min_similarity) / min_similarity)
+      first_key_id = bisect.bisect_left(self._ngram_counts, min_ngram_count)
+      last_key_id = bisect.bisect_right(self._ngram_counts, max_ngram_count)
+      postings = []
+      for ngram in ngrams:
+        posting = self._postings.get(ngram, ())
+        postings.append(posting[bisect.bisect_left(posting, first_key_id):bisect
+                                .bisect_left(posting, last_key_id)])
+      # A similar enough key shares at least min_shared_count trigrams, so it
+      # has to contain one of the rarest len(ngrams) - min_shared_count + 1.
+      min_shared_count = math.ceil(min_similarity *
+                                   (len(ngrams) + min_ngram_count) / 2)
+      postings.sort(key=len)
+      candidate_key_ids = set()
+      for posting in postings[:max(0, len(ngrams) - min_shared_count + 1)]:
+        candidate_key_ids.update(posting)
+      for key_id in candidate_key_ids:
+        shared_ngram_count = len(ngrams & get_ngrams(self._keys[key_id]))
+        score = NGRAM_MATCH_WEIGHT * 2 * shared_ngram_count / (
+            len(ngrams) + self._ngram_counts[key_id])
+        if score < threshold:
+          continue
+        for upstream_name in self._key_names[self._keys[key_id]]:
+          scores.setdefault(upstream_name, score)
+
+    return sorted(
+        scores.items(), key=lambda entry: (-entry[1], entry[0]))[:limit]
+
+  def resolve(self, package_name):
+    """Returns (upstream name, score) for the name with the same key, or None.
+
+    Returns None too if several names score the same, since there is no
+    telling which one is meant.
+    """
+    candidates = self.lookup(package_name, 2, KEY_MATCH_SCORE)
+    if not candidates:
+      return None
+    if len(candidates) > 1 and candidates[1][1] == candidates[0][1]:
+      return None
+    return candidates[0]
+
+
+def resolve_names(package_names, upstream_names, threshold, prefix=''):
+  """Returns a mapping from package name to (upstream name, score).
+
+  Only names starting with prefix are resolved, with the prefix removed.
+  Names that don't resolve are left out, and the upstream names scoring at
+  least threshold for them are logged as candidates to check by hand.
+  """
+  name_index = NameIndex(upstream_names)
+  resolved_names = {}
+  for package_name in package_names:
+    if not package_name.startswith(prefix):
+      continue
+    resolved_name = name_index.resolve(package_name[len(prefix):])
+    if resolved_name:
+      resolved_names[package_name] = resolved_name
+      continue
+    candidates = name_index.lookup(package_name[len(prefix):], 3, threshold)
+    if candidates:
+      logging.info(f'{package_name} may be ' +
+                   ', '.join(f'{upstream_name} ({score:.2f})'
+                             for upstream_name, score in candidates))
+  return resolved_names
+
+
+def get_confidences(resolved_names):
+  """Returns the scores of the names that were not spelled the same."""
+  return {
+      package_name: score
+      for package_name, (_, score) in resolved_names.items()
+      if score < 1.0
+  }
@@ -0,0 +1,325 @@
+"""Reads license() directives out of spack package.py files without Spack.
+
+Instantiating every package through Spack is slow and needs a configured
+Spack install, while most packages declare their license with a literal
+license('...') call in the class body. Those calls are read from the syntax
+tree of package.py. Anything that can only be known by running the package
+code, like a license computed at runtime or inherited from another package,
+is reported as unresolved so the caller can fall back to importing it.
+"""
+
+import ast
+import os
+import re
+
+
+class UnresolvedLicenseError(ValueError):
+  """Raised when the licenses of a package can't be read statically."""
+
+
+# Package directories in newer repositories are named after the python
+# module for the package, like py_numpy or _7zip.
+_MODULE_DIR_RE = re.compile(r'^_(?=\d)')
+
+# Modules that build system base classes come from, which declare no
+# licenses. These are checked before _PACKAGE_MODULES, which they overlap.
+_BUILD_SYSTEM_MODULES = ('spack.package', 'spack.build_systems',
+                         'spack_repo.builtin.build_systems')
+
+# Modules that other packages are imported from, which means a class can
+# inherit licenses from another package rather than from a build system.
+_PACKAGE_MODULES = ('spack.pkg', 'spack_repo')
+
+
+def get_package_name(package_dir_name):
+  return _MODULE_DIR_RE.sub('', package_dir_name).replace('_', '-')
+
+
+def get_class_name(package_name):
+  """Returns the name Spack expects the class of a package to have."""
+  class_name = ''.join(
+      name_part.capitalize() for name_part in re.split(r'[-_]+', package_name))
+  if class_name[:1].isdigit():
+    class_name = f'_{class_name}'
+  return class_name
+
+
+def get_package_files(packages_dir):
+  """Returns a mapping from package name to package.py for a packages dir."""
+  package_files = {}
+  for dir_entry in os.scandir(packages_dir):
+    package_file = os.path.join(dir_entry.path, 'package.py')
+    if dir_entry.is_dir() and os.path.exists(package_file):
+      package_files[get_package_name(dir_entry.name)] = package_file
+  return dict(sorted(package_files.items()))
+
+
+def _get_string(node, description):
+  if isinstance(node, ast.Constant) and isinstance(node.value, str):
+    return node.value
+  raise UnresolvedLicenseError(
+      f'{description} on line {node.lineno} is not a string literal')
+
+
+def is_call_to(node, function_name):
+  if not isinstance(node, ast.Call):
+    return False
+  if isinstance(node.func, ast.Name):
+    return node.func.id == function_name
+  if isinstance(node.func, ast.Attribute):
+    return node.func.attr == function_name
+  return False
+
+
+def _get_with_condition(with_node):
+  """Returns the spec condition a `with when(...)` block adds, if any."""
+  conditions = []
+  for with_item in with_node.items:
+    context_expr = with_item.context_expr
+    if is_call_to(context_expr, 'when') and len(context_expr.args) == 1:
+      conditions.append(_get_string(context_expr.args[0], 'when() condition'))
+    elif is_call_to(context_expr, 'default_args'):
+      for keyword in context_expr.keywords:
+        if keyword.arg == 'when':
+          conditions.append(_get_string(keyword.value, 'when= condition'))
+    else:
+      raise UnresolvedLicenseError(
+          f'license() is inside an unknown context on line {with_node.lineno}')
+  return ' '.join(conditions)
+
+
+def _get_license_call(call_node, condition):
+  if len(call_node.args) != 1:
+    raise UnresolvedLicenseError(
+        f'license() on line {call_node.lineno} has {len(call_node.args)} '
+        'positional arguments')
+  license_string = _get_string(call_node.args[0], 'license')
+  conditions = [condition] if condition else []
+  for keyword in call_node.keywords:
+    if keyword.arg is None:
+      raise UnresolvedLicenseError(
+          f'license() on line {call_node.lineno} takes **kwargs')
+    if keyword.arg == 'when':
+      conditions.append(_get_string(keyword.value, 'when= condition'))
+  return license_string, ' '.join(conditions) or None
+
+
+def _contains_license_call(node):
+  return any(is_call_to(child, 'license') for child in ast.walk(node))
+
+
+def _get_class_licenses(statements, condition=''):
+  licenses = []
+  for statement in statements:
+    if not _contains_license_call(statement):
+      continue
+    if (isinstance(statement, ast.Expr) and
+        is_call_to(statement.value, 'license')):
+      licenses.append(_get_license_call(statement.value, condition))
+    elif isinstance(statement, ast.With):
+      with_condition = ' '.join(
+          filter(None, [condition, _get_with_condition(statement)]))
+      licenses.extend(_get_class_licenses(statement.body, with_condition))
+    elif not isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+      # Methods calling license() aren't directives, anything else that does
+      # (loops, conditionals) depends on running the code.
+      raise UnresolvedLicenseError(
+          f'license() is called dynamically on line {statement.lineno}')
+  return licenses
+
+
+def _is_in_modules(dotted_name, module_names):
+  return any(
+      dotted_name == module_name or dotted_name.startswith(module_name + '.')
+      for module_name in module_names)
+
+
+def _get_imports(module):
+  """Returns the module level imports of a package.py.
+
+  Returns a mapping from each imported name to the dotted path it refers
+  to, and the modules that are star imported.
+  """
+  imports = {}
+  star_imports = []
+  for statement in module.body:
+    if isinstance(statement, ast.Import):
+      for alias in statement.names:
+        if alias.asname:
+          imports[alias.asname] = alias.name
+        else:
+          # `import a.b` binds a, and a.b is then reached through it.
+          root_name = alias.name.split('.')[0]
+          imports[root_name] = root_name
+    elif isinstance(statement, ast.ImportFrom) and statement.module:
+      for alias in statement.names:
+        if alias.name == '*':
+          star_imports.append(statement.module)
+        else:
+          imports[alias.asname or
+                  alias.name] = f'{statement.module}.{alias.name}'
+  return imports, star_imports
+
+
+def _get_dotted_name(node):
+  """Returns the dotted name of a Name or chain of Attributes, or None."""
+  name_parts = []
+  while isinstance(node, ast.Attribute):
+    name_parts.append(node.attr)
+    node = node.value
+  if not isinstance(node, ast.Name):
+    return None
+  name_parts.append(node.id)
+  return '.'.join(reversed(name_parts))
+
+
+def _get_inherited_licenses(class_node, local_classes, imports, star_imports,
+                            visited_classes):
+  """Returns the licenses a class gets from its base classes.
+
+  Local base classes are followed. Raises UnresolvedLicenseError for a base
+  that may be another package, or that isn't known to be a build system.
+  """
+  licenses = []
+  for base in class_node.bases:
+    base_name = _get_dotted_name(base)
+    if base_name is None:
+      raise UnresolvedLicenseError(
+          f'{class_node.name} has a computed base class on line {base.lineno}')
+
+    root_name, _, attribute_path = base_name.partition('.')
+    if root_name in local_classes and not attribute_path:
+      if root_name in visited_classes:
+        continue
+      visited_classes.add(root_name)
+      base_class = local_classes[root_name]
+      base_licenses = _get_class_licenses(base_class.body)
+      if not base_licenses:
+        base_licenses = _get_inherited_licenses(base_class, local_classes,
+                                                imports, star_imports,
+                                                visited_classes)
+      licenses.extend(base_licenses)
+      continue
+
+    if root_name in imports:
+      base_path = '.'.join(filter(None, [imports[root_name], attribute_path]))
+    elif not attribute_path and star_imports and all(
+        _is_in_modules(star_import, _BUILD_SYSTEM_MODULES)
+        for star_import in star_imports):
+      # Build system classes usually come from `from spack.package import *`.
+      continue
+    else:
+      raise UnresolvedLicenseError(
+          f'{class_node.name} has an unknown base class {base_name}')
+
+    if _is_in_modules(base_path, _BUILD_SYSTEM_MODULES):
+      continue
+    if _is_in_modules(base_path, _PACKAGE_MODULES):
+      raise UnresolvedLicenseError(
+          f'{class_node.name} may inherit licenses from {base_name}')
+    raise UnresolvedLicenseError(
+        f'{class_node.name} has an unknown base class {base_name}')
+  return licenses
+
+
+def _is_package_subclass(class_node, local_classes, visited_classes):
+  """Returns whether a class derives from a *Package class.
+
+  Local base classes are followed, so a package deriving from a helper base
+  class defined next to it counts too.
+  """
+  for base in class_node.bases:
+    base_name = _get_dotted_name(base)
+    if base_name is None:
+      continue
+    if base_name in local_classes:
+      if base_name in visited_classes:
+        continue
+      visited_classes.add(base_name)
+      if _is_package_subclass(local_classes[base_name], local_classes,
+                              visited_classes):
+        return True
+    elif base_name.rpartition('.')[2].endswith('Package'):
+      return True
+  return False
+
+
+def get_package_class(module, package_name=None):
+  """Returns the class definition of the package in a parsed package.py.
+
+  This is the class named after package_name if there is one, or the only
+  class in the file. Otherwise it is the class deriving from a *Package
+  class that no other such class derives from, which skips builder classes
+  and helper base classes. Raises UnresolvedLicenseError if there is no such
+  class or more than one.
+  """
+  local_classes = {
+      statement.name: statement
+      for statement in module.body
+      if isinstance(statement, ast.ClassDef)
+  }
+  if package_name is not None:
+    class_name = get_class_name(package_name)
+    if class_name in local_classes:
+      return local_classes[class_name]
+  if len(local_classes) == 1:
+    return next(iter(local_classes.values()))
+
+  package_classes = [
+      class_node for class_node in local_classes.values()
+      if _is_package_subclass(class_node, local_classes, {class_node.name})
+  ]
+  base_names = {
+      _get_dotted_name(base)
+      for class_node in package_classes
+      for base in class_node.bases
+  }
+  package_classes = [
+      class_node for class_node in package_classes
+      if class_node.name not in base_names
+  ]
+  if not package_classes:
+    raise UnresolvedLicenseError('has no package class')
+  if len(package_classes) > 1:
+    raise UnresolvedLicenseError('has several package classes: ' + ', '.join(
+        class_node.name for class_node in package_classes))
+  return package_classes[0]
+
+
+def get_licenses(package_source,
+                 package_file='<package.py>',
+                 package_name=None):
+  """Returns the (license, when condition) pairs a package.py declares.
+
+  The when condition is None for unconditional licenses. package_name, if
+  given, identifies the package class. Raises UnresolvedLicenseError if the
+  licenses can't be known without running the package code.
+  """
+  try:
+    module = ast.parse(package_source, package_file)
+  except SyntaxError as error:
+    raise UnresolvedLicenseError(f'{package_file} does not parse: {error}')
+
+  try:
+    package_class = get_package_class(module, package_name)
+  except UnresolvedLicenseError as error:
+    raise UnresolvedLicenseError(f'{package_file} {error}')
+  licenses = _get_class_licenses(package_class.body)
+  if licenses:
+    return licenses
+
+  local_classes = {
+      statement.name: statement
+      for statement in module.body
+      if isinstance(statement, ast.ClassDef)
+  }
+  imports, star_imports = _get_imports(module)
+  return _get_inherited_licenses(package_class, local_classes, imports,
+                                 star_imports, {package_class.name})
+
+
+def get_package_file_licenses(package_file):
+  package_name = get_package_name(
+      os.path.basename(os.path.dirname(os.path.abspath(package_file))))
+  with open(package_file, encoding='utf-8') as package_source:
+    return get_licenses(package_source.read(), package_file, package_name)
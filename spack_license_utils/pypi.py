@@ -0,0 +1,405 @@
+"""Utilities for fetching package information from PyPI.
+"""
+
+import array
+import bisect
+import codecs
+import concurrent.futures
+import gzip
+import html.parser
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import requests
+
+from tqdm import tqdm
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from spack_license_utils import spdx
+from spack_license_utils import utils
+
+PYPI_URL = 'https://pypi.org'
+
+SIMPLE_JSON_CONTENT_TYPE = 'application/vnd.pypi.simple.v1+json'
+
+# Prefer the PEP 691 JSON form of the simple index, but accept HTML from
+# indexes that don't serve it.
+SIMPLE_ACCEPT = f'{SIMPLE_JSON_CONTENT_TYPE}, text/html;q=0.1'
+
+# Rate limiting and transient server errors that are worth retrying.
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+def create_session(max_connections=1, max_retries=5, backoff_factor=0.5):
+  """Creates a session that keeps connections alive and retries with backoff.
+  """
+  retry = Retry(
+      total=max_retries,
+      backoff_factor=backoff_factor,
+      status_forcelist=RETRY_STATUSES,
+      allowed_methods=['GET'],
+      respect_retry_after_header=True,
+      raise_on_status=False)
+  adapter = HTTPAdapter(pool_maxsize=max_connections, max_retries=retry)
+  session = requests.Session()
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  return session
+
+
+def get_url(session, url, response_cache=None, headers=None):
+  """Returns the body of a successful GET of url, or None.
+
+  Goes through response_cache if one is given.
+  """
+  if response_cache is not None:
+    return response_cache.get(session, url, headers)
+  response = session.get(url, headers=headers)
+  if response.status_code != 200:
+    return None
+  return response.content
+
+
+def get_package_info(session,
+                     package_name,
+                     pypi_url=PYPI_URL,
+                     response_cache=None):
+  """Returns the decoded JSON API response for a package, or None."""
+  package_info_raw = get_url(session, f'{pypi_url}/pypi/{package_name}/json',
+                             response_cache)
+  if package_info_raw is None:
+    return None
+  return json.loads(package_info_raw)
+
+
+def normalize_name(package_name):
+  """Normalizes a package name as described in PEP 503."""
+  return re.sub(r'[-_.]+', '-', package_name).lower()
+
+
+class PackageNameIndex:
+  """A compact, sorted index of normalized package names.
+
+  The names are stored in a single newline separated string with an array of
+  offsets into it rather than as hundreds of thousands of string objects.
+  """
+
+  def __init__(self, package_names, etag=None):
+    sorted_names = sorted(set(map(normalize_name, package_names)))
+    self.etag = etag
+    self._names = '\n'.join(sorted_names) + '\n'
+    self._offsets = array.array('L', [0])
+    for package_name in sorted_names:
+      self._offsets.append(self._offsets[-1] + len(package_name) + 1)
+
+  def _get_name(self, index):
+    return self._names[self._offsets[index]:self._offsets[index + 1] - 1]
+
+  def __len__(self):
+    return len(self._offsets) - 1
+
+  def __iter__(self):
+    return (self._get_name(index) for index in range(len(self)))
+
+  def __contains__(self, package_name):
+    normalized_name = normalize_name(package_name)
+    index = bisect.bisect_left(
+        range(len(self)), normalized_name, key=self._get_name)
+    return index < len(self) and self._get_name(index) == normalized_name
+
+  def save(self, index_path):
+    with utils.atomic_write(index_path, 'wb') as compressed_index_file:
+      with gzip.open(compressed_index_file, 'wt') as index_file:
+        index_file.write(f'{self.etag or ""}\n')
+        index_file.write(self._names)
+
+  @classmethod
+  def load(cls, index_path):
+    with gzip.open(index_path, 'rt') as index_file:
+      etag = index_file.readline().rstrip('\n') or None
+      return cls((line.rstrip('\n') for line in index_file), etag)
+
+
+class _SimpleIndexParser(html.parser.HTMLParser):
+  """Collects the anchor texts of a PEP 503 HTML simple index."""
+
+  def __init__(self):
+    super().__init__()
+    self.package_names = []
+    self._in_anchor = False
+
+  def handle_starttag(self, tag, attrs):
+    self._in_anchor = tag == 'a'
+    if self._in_anchor:
+      self.package_names.append('')
+
+  def handle_endtag(self, tag):
+    if tag == 'a':
+      self._in_anchor = False
+
+  def handle_data(self, data):
+    if self._in_anchor:
+      self.package_names[-1] += data
+
+
+class _SimpleJsonIndexParser:
+  """Collects the project names of a PEP 691 JSON simple index.
+
+  The projects are decoded one at a time as the body is fed in, rather than
+  decoding the whole body into a list of project dicts at once.
+  """
+
+  def __init__(self):
+    self.package_names = []
+    self._decoder = json.JSONDecoder()
+    self._buffer = ''
+    self._position = 0
+    self._state = 'start'
+    self._key = None
+
+  def _skip_whitespace(self):
+    while (self._position < len(self._buffer) and
+           self._buffer[self._position] in ' \t\r\n'):
+      self._position += 1
+    return self._buffer[self._position:self._position + 1]
+
+  def _decode_value(self):
+    """Decodes the value at the current position.
+
+    Returns (value, True), or (None, False) if the value hasn't been fed in
+    completely yet.
+    """
+    try:
+      value, end = self._decoder.raw_decode(self._buffer, self._position)
+    except json.JSONDecodeError:
+      return None, False
+    # A number at the end of the buffer may continue in the next chunk.
+    if end == len(self._buffer):
+      return None, False
+    self._position = end
+    return value, True
+
+  def _parse_next(self):
+    """Consumes the next token. Returns False when more data is needed."""
+    character = self._skip_whitespace()
+    if not character or self._state == 'done':
+      return False
+    if self._state == 'start':
+      if character != '{':
+        raise ValueError('The simple index is not a JSON object')
+      self._position += 1
+      self._state = 'key'
+    elif self._state == 'key':
+      if character in ',}':
+        self._position += 1
+        if character == '}':
+          self._state = 'done'
+        return True
+      self._key, complete = self._decode_value()
+      if not complete:
+        return False
+      self._state = 'colon'
+    elif self._state == 'colon':
+      if character != ':':
+        raise ValueError(f'Expected ":" after {self._key!r} in the index')
+      self._position += 1
+      self._state = 'value'
+    elif self._state == 'value':
+      if self._key == 'projects' and character == '[':
+        self._position += 1
+        self._state = 'projects'
+        return True
+      _, complete = self._decode_value()
+      if not complete:
+        return False
+      self._state = 'key'
+    elif character in ',]':
+      self._position += 1
+      if character == ']':
+        self._state = 'key'
+    else:
+      project, complete = self._decode_value()
+      if not complete:
+        return False
+      self.package_names.append(project['name'])
+    return True
+
+  def feed(self, data):
+    self._buffer = self._buffer[self._position:] + data
+    self._position = 0
+    while self._parse_next():
+      pass
+
+  def close(self):
+    if self._state != 'done':
+      raise ValueError('The simple index ended unexpectedly')
+
+
+def fetch_package_name_index(session, pypi_url=PYPI_URL, etag=None):
+  """Fetches the simple index and builds a PackageNameIndex from it.
+
+  Both the JSON and HTML forms of the index are parsed as they stream in.
+  If etag is given and the index has not changed, None is returned.
+  """
+  headers = {'Accept': SIMPLE_ACCEPT}
+  if etag:
+    headers['If-None-Match'] = etag
+  with session.get(
+      f'{pypi_url}/simple/', headers=headers, stream=True) as response:
+    if response.status_code == 304:
+      return None
+    response.raise_for_status()
+    new_etag = response.headers.get('ETag')
+    if response.headers.get('Content-Type',
+                            '').startswith(SIMPLE_JSON_CONTENT_TYPE):
+      index_parser = _SimpleJsonIndexParser()
+    else:
+      index_parser = _SimpleIndexParser()
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+    for chunk in response.iter_content(chunk_size=1024 * 1024):
+      index_parser.feed(decoder.decode(chunk))
+    index_parser.feed(decoder.decode(b'', final=True))
+    index_parser.close()
+    return PackageNameIndex(index_parser.package_names, new_etag)
+
+
+def get_package_name_index(session,
+                           pypi_url=PYPI_URL,
+                           index_path=None,
+                           ttl=0,
+                           offline=False):
+  """Returns a PackageNameIndex, persisting it to index_path if it is set.
+
+  A persisted index younger than ttl seconds is used as is. An older one is
+  revalidated against its ETag. In offline mode the persisted index is always
+  used.
+  """
+  package_name_index = None
+  if index_path and os.path.exists(index_path):
+    package_name_index = PackageNameIndex.load(index_path)
+    if offline or time.time() - os.path.getmtime(index_path) < ttl:
+      return package_name_index
+  elif offline:
+    raise RuntimeError(f'No package name index at {index_path} to use offline.')
+
+  new_package_name_index = fetch_package_name_index(
+      session, pypi_url, package_name_index and package_name_index.etag)
+  if new_package_name_index is None:
+    # The index hasn't changed, just mark the persisted one as fresh.
+    os.utime(index_path)
+    return package_name_index
+  if index_path:
+    new_package_name_index.save(index_path)
+  return new_package_name_index
+
+
+def get_license_from_info(package_info, license_list):
+  if package_info is None:
+    return None
+
+  if 'info' not in package_info or 'license' not in package_info['info']:
+    return None
+
+  license_string = package_info['info']['license']
+
+  if license_string is None:
+    return None
+
+  if spdx.validate(license_string, license_list):
+    return license_string
+
+  license_string = license_string.replace(' ', '-')
+  if license_string in license_list:
+    return license_string
+
+  if hasattr(license_list, 'lookup'):
+    # Catch IDs that only differ in case, like "mit".
+    return license_list.lookup(license_string)
+
+  return None
+
+
+def fetch_package_infos(package_names,
+                        max_connections,
+                        pypi_url=PYPI_URL,
+                        max_retries=5,
+                        response_cache=None):
+  """Fetches package info for many packages with bounded concurrency.
+
+  Yields (package_name, package_info) tuples in the order the requests finish.
+  Each worker thread keeps its own keep-alive session to pypi_url.
+  """
+  thread_state = threading.local()
+
+  def fetch_package_info(package_name):
+    if not hasattr(thread_state, 'session'):
+      thread_state.session = create_session(max_retries=max_retries)
+    try:
+      return get_package_info(thread_state.session, package_name, pypi_url,
+                              response_cache)
+    except (requests.RequestException, ValueError) as error:
+      logging.warning(f'Failed to fetch info for {package_name}: {error}')
+      return None
+
+  start_time = time.monotonic()
+  fetched_count = 0
+
+  with concurrent.futures.ThreadPoolExecutor(max_connections) as executor:
+    package_info_futures = {
+        executor.submit(fetch_package_info, package_name): package_name
+        for package_name in package_names
+    }
+    for package_info_future in concurrent.futures.as_completed(
+        package_info_futures):
+      fetched_count += 1
+      yield (package_info_futures[package_info_future],
+             package_info_future.result())
+
+  elapsed_time = time.monotonic() - start_time
+  logging.info(
+      f'Fetched {fetched_count} packages from {pypi_url} in {elapsed_time:.1f}s '
+      f'({fetched_count / max(elapsed_time, 1e-6):.1f} packages/s).')
+
+
+def get_package_licenses(package_names,
+                         license_list,
+                         package_name_index,
+                         max_connections,
+                         pypi_url=PYPI_URL,
+                         max_retries=5,
+                         response_cache=None,
+                         resolved_names=None):
+  """Returns a mapping from spack package name to license for py- packages.
+
+  resolved_names optionally maps package names to (PyPI name, score), as
+  returned by names.resolve_names, for packages named differently on PyPI.
+  """
+  python_packages = {}
+  for package_name in package_names:
+    if not package_name.startswith('py-'):
+      continue
+    pypi_name = package_name[3:]
+    if resolved_names and package_name in resolved_names:
+      pypi_name, _ = resolved_names[package_name]
+    if pypi_name in package_name_index:
+      python_packages.setdefault(normalize_name(pypi_name),
+                                 []).append(package_name)
+
+  package_infos = fetch_package_infos(python_packages, max_connections,
+                                      pypi_url, max_retries, response_cache)
+
+  package_licenses = {}
+  for pypi_name, package_info in tqdm(
+      package_infos, total=len(python_packages), miniters=1):
+    pkg_license = get_license_from_info(package_info, license_list)
+    if not pkg_license:
+      continue
+    for package_name in python_packages[pypi_name]:
+      package_licenses[package_name] = pkg_license
+  return package_licenses
@@ -0,0 +1,35 @@
+"""Marshal snapshots of data compiled from slow to parse source files.
+
+A snapshot stores the data along with a format version and a signature of
+the sources it was compiled from, like their sizes and modification times,
+and is only used while both still match.
+"""
+
+import marshal
+
+from spack_license_utils import utils
+
+
+def load_snapshot(snapshot_path, version, source_signature, compile_sources):
+  """Returns the data compiled from some sources, from a snapshot if current.
+
+  If the snapshot at snapshot_path is missing or stale, compile_sources() is
+  called for the data, which is saved as the new snapshot. The data and
+  source_signature must be marshallable.
+  """
+  try:
+    with open(snapshot_path, 'rb') as snapshot_file:
+      snapshot = marshal.load(snapshot_file)
+  except (OSError, EOFError, ValueError, TypeError):
+    snapshot = None
+  if (snapshot and snapshot[0] == version and snapshot[1] == source_signature):
+    return snapshot[2]
+
+  data = compile_sources()
+  try:
+    with utils.atomic_write(snapshot_path, 'wb') as snapshot_file:
+      marshal.dump((version, source_signature, data), snapshot_file)
+  except OSError:
+    # The snapshot is only an optimization, so carry on if it can't be saved.
+    pass
+  return data
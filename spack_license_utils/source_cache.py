@@ -0,0 +1,103 @@
+"""A content-addressed cache of license detection results for staged sources.
+
+Entries are keyed by package name, version and source checksum, so a cache
+hit means the exact same source was already analyzed and staging it again
+can be skipped. Only the detected license and the hashes of the license
+files that were found are stored, not the sources themselves.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from spack_license_utils import utils
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Files at the top level of a source tree that usually hold its license.
+LICENSE_FILE_PREFIXES = ('license', 'licence', 'copying', 'copyright', 'notice',
+                         'unlicense')
+
+
+def get_cache_key(package_name, version, checksum):
+  return f'{package_name}@{version}#{checksum}'
+
+
+def hash_license_files(source_dir):
+  """Returns a mapping from license file name to the sha256 of its contents."""
+  license_file_hashes = {}
+  try:
+    dir_entries = list(os.scandir(source_dir))
+  except OSError:
+    return license_file_hashes
+  for dir_entry in dir_entries:
+    if not dir_entry.is_file():
+      continue
+    if not dir_entry.name.lower().startswith(LICENSE_FILE_PREFIXES):
+      continue
+    with open(dir_entry.path, 'rb') as license_file:
+      license_file_hashes[dir_entry.name] = hashlib.sha256(
+          license_file.read()).hexdigest()
+  return license_file_hashes
+
+
+class SourceCache:
+  """Stores detection results as small JSON files named by hash of their key.
+
+  Hits refresh the modification time of an entry, so eviction removes the
+  least recently used entries first.
+  """
+
+  def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+
+  def _get_entry_path(self, cache_key):
+    key_hash = hashlib.sha256(cache_key.encode('utf-8')).hexdigest()
+    return os.path.join(self.cache_dir, key_hash[:2], f'{key_hash}.json')
+
+  def get(self, cache_key):
+    """Returns the cached entry for a key, or None."""
+    entry_path = self._get_entry_path(cache_key)
+    try:
+      with open(entry_path) as entry_file:
+        entry = json.load(entry_file)
+    except (OSError, ValueError):
+      return None
+    if entry.get('key') != cache_key:
+      return None
+    os.utime(entry_path)
+    return entry
+
+  def put(self, cache_key, license_string, license_file_hashes):
+    entry_path = self._get_entry_path(cache_key)
+    os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+    entry = {
+        'key': cache_key,
+        'license': license_string,
+        'license_files': license_file_hashes,
+        'created_at': time.time(),
+    }
+    with utils.atomic_write(entry_path) as entry_file:
+      json.dump(entry, entry_file)
+
+  def evict(self):
+    """Removes the least recently used entries until under max_bytes."""
+    entries = []
+    total_size = 0
+    for dir_path, _, file_names in os.walk(self.cache_dir):
+      for file_name in file_names:
+        if not file_name.endswith('.json'):
+          continue
+        entry_stat = os.stat(os.path.join(dir_path, file_name))
+        entries.append((entry_stat.st_mtime, entry_stat.st_size,
+                        os.path.join(dir_path, file_name)))
+        total_size += entry_stat.st_size
+    entries.sort()
+    for _, entry_size, entry_path in entries:
+      if total_size <= self.max_bytes:
+        break
+      os.unlink(entry_path)
+      total_size -= entry_size
@@ -0,0 +1,198 @@
+"""A parser and validator for SPDX license expressions.
+"""
+
+import collections
+import functools
+import re
+
+# License IDs that spack uses that are not part of the SPDX license list.
+ALLOWED_LICENSE_IDS = frozenset(['custom', 'Public-Domain'])
+
+DEFAULT_EXCEPTIONS = frozenset(['OpenSSL-Exception', 'LLVM-exception'])
+
+License = collections.namedtuple('License', ['license_id', 'or_later'])
+LicenseRef = collections.namedtuple('LicenseRef',
+                                    ['document_ref', 'license_ref'])
+With = collections.namedtuple('With', ['license', 'exception'])
+And = collections.namedtuple('And', ['operands'])
+Or = collections.namedtuple('Or', ['operands'])
+
+_TOKEN_REGEX = re.compile(r'\s*(?:(\(|\))|([A-Za-z0-9.\-+:]+))')
+
+_LICENSE_REF_REGEX = re.compile(
+    r'^(?:DocumentRef-([A-Za-z0-9.\-]+):)?LicenseRef-([A-Za-z0-9.\-]+)$')
+
+
+class SpdxParseError(ValueError):
+  """Raised when an SPDX expression is malformed.
+
+  The token attribute holds the token that could not be parsed, or None if
+  the expression ended early.
+  """
+
+  def __init__(self, message, token=None):
+    super().__init__(message)
+    self.token = token
+
+
+def tokenize(expression):
+  tokens = []
+  position = 0
+  expression = expression.rstrip()
+  while position < len(expression):
+    token_match = _TOKEN_REGEX.match(expression, position)
+    if not token_match:
+      raise SpdxParseError(
+          f'Unexpected character "{expression[position]}" in "{expression}"',
+          expression[position])
+    tokens.append(token_match.group(1) or token_match.group(2))
+    position = token_match.end()
+  return tokens
+
+
+class _Parser:
+  """A recursive descent parser over the tokens of an SPDX expression.
+
+  OR binds more loosely than AND, which binds more loosely than WITH.
+  """
+
+  def __init__(self, tokens):
+    self._tokens = tokens
+    self._position = 0
+
+  def _peek(self):
+    if self._position < len(self._tokens):
+      return self._tokens[self._position]
+    return None
+
+  def _next(self):
+    token = self._peek()
+    if token is None:
+      raise SpdxParseError('Unexpected end of expression')
+    self._position += 1
+    return token
+
+  def parse(self):
+    expression = self._parse_or()
+    if self._peek() is not None:
+      raise SpdxParseError(f'Unexpected token "{self._peek()}"', self._peek())
+    return expression
+
+  def _parse_or(self):
+    operands = [self._parse_and()]
+    while self._peek() == 'OR':
+      self._next()
+      operands.append(self._parse_and())
+    return operands[0] if len(operands) == 1 else Or(tuple(operands))
+
+  def _parse_and(self):
+    operands = [self._parse_with()]
+    while self._peek() == 'AND':
+      self._next()
+      operands.append(self._parse_with())
+    return operands[0] if len(operands) == 1 else And(tuple(operands))
+
+  def _parse_with(self):
+    license_expression = self._parse_primary()
+    if self._peek() != 'WITH':
+      return license_expression
+    self._next()
+    if isinstance(license_expression, (And, Or)):
+      raise SpdxParseError('WITH must follow a single license', 'WITH')
+    exception = self._next()
+    if exception in ('(', ')', 'AND', 'OR', 'WITH'):
+      raise SpdxParseError(f'Expected an exception, got "{exception}"',
+                           exception)
+    return With(license_expression, exception)
+
+  def _parse_primary(self):
+    token = self._next()
+    if token == '(':
+      expression = self._parse_or()
+      if self._next() != ')':
+        raise SpdxParseError('Expected ")"', self._tokens[self._position - 1])
+      return expression
+    if token in (')', 'AND', 'OR', 'WITH'):
+      raise SpdxParseError(f'Expected a license, got "{token}"', token)
+    license_ref_match = _LICENSE_REF_REGEX.match(token)
+    if license_ref_match:
+      return LicenseRef(license_ref_match.group(1), license_ref_match.group(2))
+    if token.endswith('+'):
+      return License(token[:-1], True)
+    return License(token, False)
+
+
+@functools.lru_cache(maxsize=65536)
+def _parse(expression):
+  try:
+    return _Parser(tokenize(expression)).parse(), None
+  except SpdxParseError as error:
+    return None, error
+
+
+def parse(expression):
+  """Parses an SPDX expression into a tree of namedtuples.
+
+  Results are cached by expression string. Raises SpdxParseError if the
+  expression is malformed.
+  """
+  parsed_expression, error = _parse(expression)
+  if error is not None:
+    raise SpdxParseError(str(error), error.token)
+  return parsed_expression
+
+
+def _get_invalid_ids(parsed_expression, license_map, exception_map):
+  match parsed_expression:
+    case License(license_id, or_later):
+      if license_id in ALLOWED_LICENSE_IDS or license_id in license_map:
+        return []
+      if or_later and f'{license_id}+' in license_map:
+        # Deprecated IDs like GPL-2.0+ are in the license list as is.
+        return []
+      return [license_id]
+    case LicenseRef():
+      return []
+    case With(license_expression, exception):
+      invalid_ids = _get_invalid_ids(license_expression, license_map,
+                                     exception_map)
+      if exception not in exception_map:
+        invalid_ids.append(exception)
+      return invalid_ids
+    case And(operands) | Or(operands):
+      invalid_ids = []
+      for operand in operands:
+        invalid_ids.extend(
+            _get_invalid_ids(operand, license_map, exception_map))
+      return invalid_ids
+
+
+def get_invalid_ids(expression, license_map, exception_map=None):
+  """Returns the license and exception IDs in an expression that are invalid.
+
+  If the expression can't be parsed, the offending token (or the whole
+  expression if it ended early) is returned. If exception_map isn't given,
+  the exceptions of license_map are used if it is a catalog.Catalog, and
+  DEFAULT_EXCEPTIONS otherwise.
+  """
+  parsed_expression, error = _parse(expression)
+  if error is not None:
+    return [error.token or expression]
+  if exception_map is None:
+    exception_map = getattr(license_map, 'exceptions', DEFAULT_EXCEPTIONS)
+  return _get_invalid_ids(parsed_expression, license_map, exception_map)
+
+
+def validate(expression, license_map, exception_map=None):
+  return not get_invalid_ids(expression, license_map, exception_map)
+
+
+def validate_many(expressions, license_map, exception_map=None):
+  """Validates many expressions, parsing each distinct expression only once.
+
+  Returns a dict mapping each distinct expression to whether it is valid.
+  """
+  return {
+      expression: validate(expression, license_map, exception_map)
+      for expression in set(expressions)
+  }
@@ -0,0 +1,502 @@
+"""Utilities for detecting licenses by having spack stage package sources and
+running the go license detector over them.
+"""
+
+import collections
+import logging
+import subprocess
+import shutil
+import json
+import os
+import time
+
+from spack_license_utils import executors
+from spack_license_utils import history
+from spack_license_utils import matcher
+from spack_license_utils import utils
+from spack_license_utils import source_cache
+
+DEFAULT_DOWNLOAD_CONCURRENCY = 8
+
+# The largest number of packages to run the license detector over at once.
+DEFAULT_MAX_BATCH_SIZE = 16
+
+# The confidence a match needs before a license is considered detected.
+DETECTION_CONFIDENCE = 0.9
+
+# The number of seconds a single license detector run may take.
+DETECTOR_TIMEOUT = 300
+
+# Run through `spack python` to print the version and source checksum that
+# `spack stage` would pick for each package named on stdin.
+_SOURCE_KEY_SCRIPT = """
+import json
+import sys
+
+import spack.repo
+
+for package_name in json.load(sys.stdin):
+  try:
+    pkg_class = spack.repo.PATH.get_pkg_class(package_name)
+  except Exception:
+    continue
+  versions = [
+      (bool(info.get('preferred')), not info.get('deprecated'),
+       not version.isdevelop(), version, info)
+      for version, info in pkg_class.versions.items()
+  ]
+  if not versions:
+    continue
+  *_, version, info = max(versions)
+  checksum = ''
+  for checksum_field in ('sha256', 'sha512', 'md5', 'commit', 'tag', 'branch'):
+    if info.get(checksum_field):
+      checksum = f'{checksum_field}:{info[checksum_field]}'
+      break
+  print(json.dumps([package_name, str(version), checksum]))
+"""
+
+
+def get_source_keys(package_names):
+  """Returns a mapping from package name to a source cache key.
+
+  The keys are computed for all packages with a single spack invocation.
+  Packages whose version or checksum can't be determined are left out.
+  """
+  spack_python_process = subprocess.run(
+      ['spack', 'python', '-c', _SOURCE_KEY_SCRIPT],
+      input=json.dumps(list(package_names)).encode('utf-8'),
+      stdout=subprocess.PIPE)
+  if spack_python_process.returncode != 0:
+    logging.warning('Failed to get package versions from spack.')
+    return {}
+  source_keys = {}
+  for line in spack_python_process.stdout.decode('utf-8').splitlines():
+    package_name, version, checksum = json.loads(line)
+    if checksum:
+      source_keys[package_name] = source_cache.get_cache_key(
+          package_name, version, checksum)
+  return source_keys
+
+
+def _get_license_from_project(project):
+  if 'error' in project:
+    return 'NOASSERTION'
+  licenses_matched = project['matches']
+  if licenses_matched[0]['confidence'] > DETECTION_CONFIDENCE:
+    return licenses_matched[0]['license']
+  return 'NOASSERTION'
+
+
+def run_license_detector(source_dirs):
+  """Runs the license detector once over several source trees.
+
+  Returns a mapping from source directory to detected license, or None if
+  the detector failed or timed out.
+  """
+  detector_command_line = ['license-detector', '-f', 'json', *source_dirs]
+  try:
+    license_detector_process = subprocess.run(
+        detector_command_line, stdout=subprocess.PIPE, timeout=DETECTOR_TIMEOUT)
+  except subprocess.TimeoutExpired:
+    logging.info('license-detector timeout expired')
+    return None
+  if license_detector_process.returncode != 0:
+    logging.info('license-detector failed')
+    return None
+  license_info = json.loads(license_detector_process.stdout.decode('utf-8'))
+  # Each project is reported under the path it was given as.
+  source_dirs_by_path = {
+      os.path.normpath(source_dir): source_dir for source_dir in source_dirs
+  }
+  detected_licenses = {}
+  for project in license_info:
+    source_dir = source_dirs_by_path.get(
+        os.path.normpath(project.get('project', '')))
+    if source_dir is not None:
+      detected_licenses[source_dir] = _get_license_from_project(project)
+  return detected_licenses
+
+
+def get_matched_license_from_dir(repo_dir, license_texts_dir):
+  """Matches the top level license files of a staged source tree in-process.
+
+  Returns the matched license, or 'NOASSERTION' if the match isn't confident.
+  """
+  license_string, confidence = matcher.match_license_files(
+      os.path.join(repo_dir, 'spack-src'),
+      matcher.load_index(license_texts_dir), DETECTION_CONFIDENCE)
+  if confidence > DETECTION_CONFIDENCE:
+    return license_string
+  return 'NOASSERTION'
+
+
+def stage_package(package_name):
+  """Has spack stage a package. Returns the stage directory, or None."""
+  spack_stage_command = ['spack', 'stage', package_name]
+  spack_stage_process = subprocess.run(
+      spack_stage_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+  if spack_stage_process.returncode != 0:
+    return None
+  stdout_lines = spack_stage_process.stdout.decode('utf-8').split('\n')
+  return stdout_lines[-2].split(' ')[-1]
+
+
+def get_tree_size(path):
+  tree_size = 0
+  for dir_path, _, file_names in os.walk(path):
+    for file_name in file_names:
+      try:
+        tree_size += os.lstat(os.path.join(dir_path, file_name)).st_size
+      except OSError:
+        pass
+  return tree_size
+
+
+def stage_and_measure_package(package_name):
+  """Stages a package, timing it and measuring the size of the source.
+
+  Returns the stage directory (or None), the seconds it took and the size of
+  the staged tree in bytes.
+  """
+  start_time = time.monotonic()
+  source_path = stage_package(package_name)
+  stage_seconds = time.monotonic() - start_time
+  if source_path is None:
+    return None, stage_seconds, 0
+  return source_path, stage_seconds, get_tree_size(source_path)
+
+
+def detect_staged_licenses(staged_packages, license_texts_dir=None):
+  """Detects licenses for a batch of staged packages and removes the stages.
+
+  staged_packages is a list of (package name, stage directory, source bytes)
+  tuples. The packages that in-process matching can't settle go through a
+  single license detector run. If that run fails or times out, each of them
+  is retried on its own.
+
+  Returns a list of (package name, license, license file hashes) tuples, the
+  detector's (package count, seconds, whether it timed out or failed) and a
+  mapping from package name to the seconds detecting it took. The hashes are
+  None for packages the detector failed on, since that result says nothing
+  about their source.
+  """
+  detected_licenses = {}
+  package_seconds = {}
+  undetected_packages = []
+  for package_name, source_path, source_bytes in staged_packages:
+    package_seconds[package_name] = 0.0
+    if license_texts_dir:
+      start_time = time.monotonic()
+      detected_licenses[package_name] = get_matched_license_from_dir(
+          source_path, license_texts_dir)
+      package_seconds[package_name] = time.monotonic() - start_time
+    if detected_licenses.get(package_name, 'NOASSERTION') == 'NOASSERTION':
+      undetected_packages.append(
+          (package_name, os.path.join(source_path, 'spack-src'), source_bytes))
+
+  detector_seconds = 0.0
+  detector_failed = False
+  failed_package_names = set()
+  if undetected_packages:
+    start_time = time.monotonic()
+    batch_licenses = run_license_detector(
+        [source_dir for _, source_dir, _ in undetected_packages])
+    detector_seconds = time.monotonic() - start_time
+    if batch_licenses is None and len(undetected_packages) > 1:
+      # The retries time each package on its own.
+      detector_failed = True
+      batch_licenses = {}
+      for package_name, source_dir, _ in undetected_packages:
+        start_time = time.monotonic()
+        batch_licenses.update(run_license_detector([source_dir]) or {})
+        package_seconds[package_name] += time.monotonic() - start_time
+    else:
+      # The detector doesn't time projects, so its run is split between them
+      # by source size, which the time it takes mostly depends on.
+      total_bytes = sum(
+          source_bytes for _, _, source_bytes in undetected_packages)
+      for package_name, _, source_bytes in undetected_packages:
+        if total_bytes:
+          package_share = source_bytes / total_bytes
+        else:
+          package_share = 1 / len(undetected_packages)
+        package_seconds[package_name] += detector_seconds * package_share
+    batch_licenses = batch_licenses or {}
+    for package_name, source_dir, _ in undetected_packages:
+      if source_dir in batch_licenses:
+        detected_licenses[package_name] = batch_licenses[source_dir]
+      else:
+        detected_licenses[package_name] = 'NOASSERTION'
+        failed_package_names.add(package_name)
+
+  detection_results = []
+  for package_name, source_path, _ in staged_packages:
+    license_file_hashes = None
+    if package_name not in failed_package_names:
+      license_file_hashes = source_cache.hash_license_files(
+          os.path.join(source_path, 'spack-src'))
+    shutil.rmtree(source_path)
+    detection_results.append(
+        (package_name, detected_licenses[package_name], license_file_hashes))
+
+  return detection_results, (len(undetected_packages), detector_seconds,
+                             detector_failed), package_seconds
+
+
+class _StageThroughput:
+  """Tracks how many packages have made it through one stage of detection."""
+
+  def __init__(self, stage_name):
+    self.stage_name = stage_name
+    self.completed = 0
+    self._start_time = time.monotonic()
+
+  def __str__(self):
+    elapsed_time = max(time.monotonic() - self._start_time, 1e-6)
+    return (f'{self.stage_name} {self.completed} '
+            f'({self.completed / elapsed_time * 60:.1f}/min)')
+
+
+class _BatchSizer:
+  """Adapts how many packages go through one license detector run.
+
+  Batches are sized so that a run is expected to take at most half the
+  detector timeout, based on a moving average of the time per package. A
+  run that times out or fails halves the batch size.
+  """
+
+  def __init__(self, max_batch_size):
+    self.max_batch_size = max_batch_size
+    self.batch_size = 1
+    self._seconds_per_package = None
+
+  def update(self, package_count, detector_seconds, detector_failed):
+    if detector_failed:
+      self.batch_size = max(1, self.batch_size // 2)
+      return
+    if package_count == 0:
+      return
+    seconds_per_package = detector_seconds / package_count
+    if self._seconds_per_package is None:
+      self._seconds_per_package = seconds_per_package
+    else:
+      self._seconds_per_package = (0.8 * self._seconds_per_package +
+                                   0.2 * seconds_per_package)
+    self.batch_size = max(
+        1,
+        min(self.max_batch_size,
+            int(DETECTOR_TIMEOUT / 2 / max(self._seconds_per_package, 1e-3))))
+
+
+def _take_batch(staged_packages, batch_size):
+  """Removes up to batch_size staged packages that share a node."""
+  _, _, node_id, _ = staged_packages[0]
+  batch = []
+  remaining_packages = collections.deque()
+  while staged_packages:
+    package_name, source_path, package_node_id, source_bytes = (
+        staged_packages.popleft())
+    if package_node_id == node_id and len(batch) < batch_size:
+      batch.append((package_name, source_path, source_bytes))
+    else:
+      remaining_packages.append(
+          (package_name, source_path, package_node_id, source_bytes))
+  staged_packages.extend(remaining_packages)
+  return node_id, batch
+
+
+def run_detection(executor,
+                  package_names,
+                  download_concurrency,
+                  staged_queue_size,
+                  license_texts_dir=None,
+                  max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                  stage_history=None):
+  """Stages and detects licenses for packages as a two stage pipeline.
+
+  Up to download_concurrency packages are staged at once, and up to
+  executor.detect_workers batches of staged packages are run through the
+  detector at once. At most staged_queue_size packages are left staged
+  waiting for a detector, and staging pauses while that queue is full.
+  Detection runs on the node that staged the packages, and batches grow up
+  to max_batch_size while detector runs stay well under the timeout.
+  Packages are staged in the order given, and their timings are recorded in
+  stage_history if it is given.
+
+  Yields (package name, license, license file hashes) tuples as packages
+  finish. The hashes are None if the package couldn't be staged or the
+  license detector failed on it.
+  """
+  pending_package_names = collections.deque(package_names)
+  staged_packages = collections.deque()
+  stage_futures = {}
+  detect_futures = set()
+
+  stage_throughput = _StageThroughput('staged')
+  detect_throughput = _StageThroughput('detected')
+  batch_sizer = _BatchSizer(max_batch_size)
+
+  while (pending_package_names or staged_packages or stage_futures or
+         detect_futures):
+    while (pending_package_names and
+           len(stage_futures) < download_concurrency and
+           len(stage_futures) + len(staged_packages) < staged_queue_size):
+      package_name = pending_package_names.popleft()
+      stage_futures[executor.submit_stage(stage_and_measure_package,
+                                          package_name)] = package_name
+
+    while (staged_packages and len(detect_futures) < executor.detect_workers):
+      node_id, batch = _take_batch(staged_packages, batch_sizer.batch_size)
+      detect_futures.add(
+          executor.submit_detect(node_id, detect_staged_licenses, batch,
+                                 license_texts_dir))
+
+    finished = executor.wait(
+        list(stage_futures) + list(detect_futures), timeout=5.0)
+
+    for finished_future in finished:
+      if finished_future in stage_futures:
+        package_name = stage_futures.pop(finished_future)
+        node_id, (source_path, stage_seconds,
+                  source_bytes) = executor.result(finished_future)
+        stage_throughput.completed += 1
+        if stage_history is not None:
+          stage_history.record_stage(package_name, stage_seconds, source_bytes)
+        if source_path is None:
+          yield package_name, 'NOASSERTION', None
+        else:
+          staged_packages.append(
+              (package_name, source_path, node_id, source_bytes))
+      else:
+        detect_futures.remove(finished_future)
+        _, (detection_results, detector_stats,
+            package_seconds) = executor.result(finished_future)
+        batch_sizer.update(*detector_stats)
+        if stage_history is not None:
+          for package_name, detect_seconds in package_seconds.items():
+            stage_history.record_detect(package_name, detect_seconds)
+        detect_throughput.completed += len(detection_results)
+        yield from detection_results
+
+    logging.info(
+        f'{stage_throughput}, {detect_throughput}, '
+        f'{len(stage_futures)} staging, {len(staged_packages)} waiting, '
+        f'{len(detect_futures)} detecting, '
+        f'{len(pending_package_names)} remaining, '
+        f'batch size {batch_sizer.batch_size}.')
+
+
+def get_package_licenses(package_names,
+                         cache=None,
+                         executor_name=executors.DEFAULT_EXECUTOR,
+                         download_concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+                         detect_workers=None,
+                         staged_queue_size=None,
+                         journal=None,
+                         license_texts_dir=None,
+                         max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                         stage_history=None):
+  """Detects licenses for packages on the named executor backend.
+
+  If a source_cache.SourceCache is given, packages whose exact source was
+  analyzed before are not staged again. detect_workers defaults to the
+  number of CPUs available to the executor and staged_queue_size to twice
+  that. If a journal.Journal is given, every result is appended to it as soon
+  as it is known. If license_texts_dir is given, license files are matched
+  against the SPDX license texts in it before falling back to the license
+  detector. Up to max_batch_size packages share a license detector run. If a
+  history.StageHistory is given, the packages expected to take longest are
+  started first, and the timings of this run are added to the history.
+  Returns a mapping from package name to the detected license for the
+  packages where detection succeeded.
+  """
+  detected_license_map = {}
+
+  detected_licenses_count = 0
+  failed_detection = 0
+
+  source_keys = {}
+  if cache is not None:
+    source_keys = get_source_keys(package_names)
+    uncached_package_names = []
+    for package_name in package_names:
+      cache_entry = None
+      if package_name in source_keys:
+        cache_entry = cache.get(source_keys[package_name])
+      if cache_entry is None:
+        uncached_package_names.append(package_name)
+        continue
+      if journal is not None:
+        journal.append(package_name, cache_entry['license'])
+      if cache_entry['license'] == 'NOASSERTION':
+        failed_detection += 1
+      else:
+        detected_license_map[package_name] = cache_entry['license']
+        detected_licenses_count += 1
+    logging.info(f'Found {len(package_names) - len(uncached_package_names)} '
+                 'packages in the source cache.')
+    package_names = uncached_package_names
+
+  # Skip starting an executor (and possibly Ray) when everything was cached.
+  if package_names:
+    executor = executors.get_executor(executor_name, download_concurrency,
+                                      detect_workers)
+    staged_queue_size = staged_queue_size or 2 * executor.detect_workers
+
+    if stage_history is not None:
+      package_names = stage_history.sort_longest_first(package_names)
+      estimates = [
+          stage_history.estimate(package_name) for package_name in package_names
+      ]
+      # Staging and detection overlap, so the slower of the two pools bounds
+      # how long the run takes.
+      predicted_makespan = max(
+          history.predict_makespan(
+              [stage_seconds for stage_seconds, _ in estimates],
+              download_concurrency),
+          history.predict_makespan(
+              [detect_seconds for _, detect_seconds in estimates],
+              executor.detect_workers))
+      logging.info(f'Predicted makespan is {predicted_makespan:.0f}s.')
+    start_time = time.monotonic()
+
+    try:
+      for package_name, license_string, license_file_hashes in run_detection(
+          executor, package_names, download_concurrency, staged_queue_size,
+          license_texts_dir, max_batch_size, stage_history):
+        # Packages that couldn't be staged or that the detector failed on
+        # have no hashes, and are left out of the cache so they are retried.
+        if license_file_hashes is not None and package_name in source_keys:
+          cache.put(source_keys[package_name], license_string,
+                    license_file_hashes)
+        if journal is not None:
+          journal.append(package_name, license_string)
+        if license_string == 'NOASSERTION':
+          failed_detection += 1
+          continue
+        detected_license_map[package_name] = license_string
+        detected_licenses_count += 1
+    finally:
+      # Keep the timings of an interrupted run too.
+      if stage_history is not None:
+        stage_history.save()
+      executor.shutdown()
+
+    if stage_history is not None:
+      logging.info(
+          f'Predicted makespan was {predicted_makespan:.0f}s, actual makespan '
+          f'was {time.monotonic() - start_time:.0f}s.')
+
+  if cache is not None:
+    cache.evict()
+
+  logging.info(
+      f'Found license information for {detected_licenses_count} packages')
+  logging.info(
+      f'Failed to find license information for {failed_detection} packages')
+
+  return {
+      package_name: utils.upgrade_deprecated_spdx_id(detected_license)
+      for package_name, detected_license in detected_license_map.items()
+  }
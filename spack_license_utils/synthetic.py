@@ -0,0 +1,246 @@
+"""Generators for synthetic inputs to benchmark the license tools with.
+
+Every generator takes a random.Random, so the same seed always produces the
+same fixtures. The license values mimic the variety found in the real data
+sources, including the malformed ones the tools have to cope with.
+"""
+
+import gzip
+import http.server
+import json
+import os
+import threading
+
+from spack_license_utils import alpine
+from spack_license_utils import package_ast
+
+SPDX_LICENSES = [
+    'MIT', 'Apache-2.0', 'BSD-2-Clause', 'BSD-3-Clause', 'GPL-2.0-only',
+    'GPL-2.0-or-later', 'GPL-3.0-only', 'GPL-3.0-or-later', 'LGPL-2.1-only',
+    'LGPL-2.1-or-later', 'LGPL-3.0-or-later', 'MPL-2.0', 'ISC', 'Zlib',
+    'Unlicense', 'CC0-1.0', 'OFL-1.1', 'Artistic-2.0', 'BSL-1.0', 'EPL-2.0'
+]
+
+# Values found in APKBUILD license= fields besides plain SPDX IDs.
+ALPINE_LICENSE_VARIANTS = [
+    'custom',
+    'GPL-2.0+',
+    'GPL-2.0-or-later WITH Classpath-exception-2.0',
+    'LGPL-2.1-or-later AND (MIT OR Apache-2.0)',
+    'custom:Proprietary',
+    'Public-Domain',
+    'BSD',
+    'GPL2',
+]
+
+# License fields as they appear in CRAN, including the ones that need
+# normalizing.
+CRAN_LICENSE_VARIANTS = [
+    'GPL-2', 'GPL-3', 'GPL (>= 2)', 'GPL (>= 3)', 'GPL-2 | GPL-3',
+    'MIT + file LICENSE', 'BSD_3_clause + file LICENSE', 'LGPL (>= 2.1)',
+    'Apache License 2.0', 'CC BY 4.0', 'CC BY-SA 4.0', 'Artistic-2.0', 'AGPL-3',
+    'file LICENSE', 'Unlimited', 'MPL-2.0 | file LICENSE'
+]
+
+PYPI_LICENSE_VARIANTS = [
+    'MIT', 'MIT License', 'BSD', 'BSD-3-Clause', 'Apache 2.0', 'Apache-2.0',
+    'GPLv3', '', 'UNKNOWN', 'LGPL-2.1-or-later'
+]
+
+
+def get_package_names(rng, package_count, prefix=''):
+  """Returns package_count unique, realistic looking package names."""
+  syllables = [
+      'lib', 'py', 'gnu', 'x', 'net', 'ssl', 'xml', 'cpp', 'mpi', 'io', 'zip',
+      'tool', 'kit', 'fast', 'geo', 'math', 'num', 'data', 'sci', 'web'
+  ]
+  package_names = set()
+  while len(package_names) < package_count:
+    name_parts = rng.sample(syllables, rng.randint(1, 3))
+    package_names.add(prefix + '-'.join(name_parts) + str(rng.randint(0, 9999)))
+  return sorted(package_names)
+
+
+def get_alpine_license(rng):
+  if rng.random() < 0.75:
+    license_ids = rng.sample(SPDX_LICENSES, rng.choice([1, 1, 1, 2, 3]))
+    return rng.choice([' AND ', ' OR ']).join(license_ids)
+  return rng.choice(ALPINE_LICENSE_VARIANTS)
+
+
+def write_aports_tree(aports_dir, rng, package_count):
+  """Writes an aports checkout of package_count APKBUILDs.
+
+  Returns the (repository, package) pairs that were written.
+  """
+  packages = []
+  for package_name in get_package_names(rng, package_count):
+    repository = rng.choice(alpine.REPOSITORIES)
+    package_dir = os.path.join(aports_dir, repository, package_name)
+    os.makedirs(package_dir, exist_ok=True)
+    license_value = get_alpine_license(rng)
+    if ' ' in license_value and rng.random() < 0.3:
+      # Long license fields are sometimes wrapped over several lines.
+      license_line = 'license="' + license_value.replace(
+          ' AND ', '\n\tAND ', 1) + '"'
+    elif ' ' in license_value or rng.random() < 0.5:
+      license_line = f'license="{license_value}"'
+    else:
+      license_line = f'license={license_value}'
+    with open(os.path.join(package_dir, 'APKBUILD'), 'w') as apkbuild_file:
+      apkbuild_file.write(
+          f'# Maintainer: Someone <someone@example.org>\n'
+          f'pkgname={package_name}\n'
+          f'pkgver={rng.randint(0, 20)}.{rng.randint(0, 20)}\n'
+          f'pkgrel=0\n'
+          f'pkgdesc="A synthetic package"\n'
+          f'url="https://example.org/{package_name}"\n'
+          f'arch="all"\n'
+          f'{license_line}\n'
+          f'depends="musl"\n'
+          f'source="https://example.org/{package_name}.tar.gz"\n\n'
+          f'build() {{\n\tmake\n}}\n\n'
+          f'package() {{\n\tmake DESTDIR="$pkgdir" install\n}}\n')
+    packages.append((repository, package_name))
+  return packages
+
+
+def write_spack_tree(spack_checkout, rng, package_count):
+  """Writes the builtin packages of a spack checkout, and a packages.csv.
+
+  About half of the packages declare a license. Returns the path of the
+  packages.csv, which lists every package in the get-packages.py format.
+  """
+  packages_dir = os.path.join(spack_checkout, 'var', 'spack', 'repos',
+                              'builtin', 'packages')
+  package_rows = []
+  package_names = (
+      get_package_names(rng, package_count // 2) +
+      get_package_names(rng, package_count - package_count // 2, prefix='py-'))
+  for package_name in package_names:
+    package_dir = os.path.join(packages_dir, package_name)
+    os.makedirs(package_dir, exist_ok=True)
+    license_id = rng.choice(SPDX_LICENSES) if rng.random() < 0.5 else None
+    versions = ''.join(
+        f'    version("{major}.{rng.randint(0, 9)}", sha256="{"0" * 64}")\n'
+        for major in range(rng.randint(1, 8), 0, -1))
+    with open(os.path.join(package_dir, 'package.py'), 'w') as package_file:
+      package_file.write(
+          'from spack.package import *\n\n\n'
+          f'class {package_ast.get_class_name(package_name)}(AutotoolsPackage):\n'
+          '    """A synthetic package."""\n\n'
+          f'    homepage = "https://example.org/{package_name}"\n'
+          f'    url = "https://example.org/{package_name}-1.0.tar.gz"\n\n'
+          '    maintainers("someone")\n\n' +
+          (f'    license("{license_id}")\n\n' if license_id else '') +
+          versions + '\n    depends_on("zlib")\n')
+    if license_id:
+      package_rows.append(f'{package_name},{license_id},Spack\n')
+    else:
+      package_rows.append(f'{package_name},UNKNOWN,NONE\n')
+
+  packages_csv_path = os.path.join(spack_checkout, 'packages.csv')
+  with open(packages_csv_path, 'w') as packages_csv:
+    packages_csv.writelines(package_rows)
+  return packages_csv_path
+
+
+def write_cran_licenses(cran_dir, rng, package_count):
+  """Writes a gather-r-licenses.R style CSV and a PACKAGES.gz index.
+
+  Returns the paths of the two files.
+  """
+  os.makedirs(cran_dir, exist_ok=True)
+  r_licenses_path = os.path.join(cran_dir, 'r-licenses.csv')
+  packages_path = os.path.join(cran_dir, 'PACKAGES.gz')
+  package_names = get_package_names(rng, package_count)
+  with open(r_licenses_path, 'w') as r_licenses_file, gzip.open(
+      packages_path, 'wt', encoding='utf-8') as packages_file:
+    r_licenses_file.write('"","Package","License"\n')
+    for package_name in package_names:
+      license_text = rng.choice(CRAN_LICENSE_VARIANTS)
+      r_licenses_file.write(
+          f'"{package_name}","{package_name}","{license_text}"\n')
+      packages_file.write(f'Package: {package_name}\n'
+                          f'Version: 1.{rng.randint(0, 99)}\n'
+                          'Depends: R (>= 3.5.0)\n'
+                          f'License: {license_text}\n'
+                          'NeedsCompilation: no\n\n')
+  return r_licenses_path, packages_path
+
+
+class PyPIServer:
+  """A local stand-in for PyPI, serving the simple index and JSON API.
+
+  Use as a context manager. The server listens on an ephemeral port of
+  127.0.0.1, and url is the base URL to pass as pypi_url.
+  """
+
+  def __init__(self, rng, package_names):
+    self.package_licenses = {
+        package_name: rng.choice(PYPI_LICENSE_VARIANTS)
+        for package_name in package_names
+    }
+    simple_index = {
+        'meta': {
+            'api-version': '1.0'
+        },
+        'projects': [{
+            'name': package_name
+        } for package_name in package_names]
+    }
+    self._simple_index_body = json.dumps(simple_index).encode('utf-8')
+    self._server = None
+    self._server_thread = None
+    self.url = None
+
+  def _make_handler(self):
+    pypi_server = self
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def _send(self, status, body=b'', content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def do_GET(self):
+        if self.path.rstrip('/') == '/simple':
+          self._send(200, pypi_server._simple_index_body,
+                     'application/vnd.pypi.simple.v1+json')
+          return
+        path_parts = self.path.strip('/').split('/')
+        if (len(path_parts) == 3 and path_parts[0] == 'pypi' and
+            path_parts[1] in pypi_server.package_licenses):
+          package_info = {
+              'info': {
+                  'name': path_parts[1],
+                  'license': pypi_server.package_licenses[path_parts[1]]
+              }
+          }
+          self._send(200, json.dumps(package_info).encode('utf-8'))
+          return
+        self._send(404)
+
+      def log_message(self, *args):
+        pass
+
+    return Handler
+
+  def __enter__(self):
+    self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                   self._make_handler())
+    self._server.daemon_threads = True
+    self._server_thread = threading.Thread(
+        target=self._server.serve_forever, daemon=True)
+    self._server_thread.start()
+    self.url = f'http://127.0.0.1:{self._server.server_address[1]}'
+    return self
+
+  def __exit__(self, *exc_info):
+    self._server.shutdown()
+    self._server.server_close()
+    self._server_thread.join()
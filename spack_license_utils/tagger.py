@@ -0,0 +1,97 @@
+"""Plans where license() directives go in spack package.py files.
+
+The directive goes right above the first version() directive of the package
+class, along with a comment asking for the license to be verified. The
+position comes from the syntax tree of the file, so layouts the planner
+doesn't understand are reported instead of producing a broken file.
+"""
+
+import ast
+import difflib
+
+from spack_license_utils import package_ast
+
+LICENSE_COMMENT = (
+    '# License needs verification, see https://github.com/spack/spack/issues/41155'
+)
+
+
+class TaggingError(ValueError):
+  """Raised when a package.py can't be tagged with a license."""
+
+
+def _contains_call_to(node, function_name):
+  return any(
+      package_ast.is_call_to(child, function_name) for child in ast.walk(node))
+
+
+def get_insertion_line(package_source, package_name=None):
+  """Returns the index of the line the license directive goes above.
+
+  This is the class level statement holding the first version() directive
+  of the package class, moved up past any comments directly above it.
+  Returns None if the package already declares a license.
+  """
+  try:
+    module = ast.parse(package_source)
+  except SyntaxError as error:
+    raise TaggingError(f'does not parse: {error}')
+
+  try:
+    package_class = package_ast.get_package_class(module, package_name)
+  except package_ast.UnresolvedLicenseError as error:
+    raise TaggingError(str(error))
+
+  if _contains_call_to(package_class, 'license'):
+    return None
+
+  for statement in package_class.body:
+    if _contains_call_to(statement, 'version'):
+      break
+  else:
+    raise TaggingError(f'{package_class.name} has no version() directive')
+
+  package_lines = package_source.splitlines(keepends=True)
+  line_index = statement.lineno - 1
+  while (line_index > package_class.lineno and
+         package_lines[line_index - 1].strip().startswith('#')):
+    line_index -= 1
+  return line_index
+
+
+def add_license(package_source, license, package_name=None):
+  """Returns package_source with a license() directive for license added.
+
+  Returns package_source unchanged if it already declares a license.
+  package_name, if given, identifies the package class.
+  """
+  line_index = get_insertion_line(package_source, package_name)
+  if line_index is None:
+    return package_source
+
+  package_lines = package_source.splitlines(keepends=True)
+  insertion_line = package_lines[line_index]
+  indent = insertion_line[:len(insertion_line) - len(insertion_line.lstrip())]
+
+  license_lines = [
+      f'{indent}{LICENSE_COMMENT}\n',
+      f'{indent}license("{license}")\n',
+      '\n',
+  ]
+  # Keep the directive visually separate from whatever comes before it, like
+  # maintainers() or class attributes packed right above the versions.
+  if line_index > 0 and package_lines[line_index - 1].strip():
+    license_lines.insert(0, '\n')
+
+  return ''.join(package_lines[:line_index] + license_lines +
+                 package_lines[line_index:])
+
+
+def get_patch(package_path, old_source, new_source):
+  """Returns a unified diff between two versions of a file."""
+  return ''.join(
+      difflib.unified_diff(
+          old_source.splitlines(keepends=True),
+          new_source.splitlines(keepends=True),
+          fromfile=f'a/{package_path}',
+          tofile=f'b/{package_path}'))
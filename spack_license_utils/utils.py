@@ -1,27 +1,163 @@
 """Some utilities for the license collection infra."""
 
-import json
+import contextlib
+import csv
+import os
+import tempfile
+
+from spack_license_utils import catalog
+from spack_license_utils import spdx
+
+
+class LicenseRecord:
+  """A package along with its license and where the license came from.
+
+  confidence and updated_at are optional extra columns.
+  """
+
+  __slots__ = ('name', 'license', 'source', 'confidence', 'updated_at')
+
+  def __init__(self, name, license, source, confidence=None, updated_at=None):
+    self.name = name
+    self.license = license
+    self.source = source
+    self.confidence = confidence
+    self.updated_at = updated_at
+
+  def __eq__(self, other):
+    if not isinstance(other, LicenseRecord):
+      return NotImplemented
+    return self.to_row() == other.to_row()
+
+  def __repr__(self):
+    return f'LicenseRecord{tuple(self.to_row())!r}'
+
+  def to_row(self):
+    row = [self.name, self.license, self.source]
+    if self.confidence is not None or self.updated_at is not None:
+      row.append('' if self.confidence is None else f'{self.confidence:g}')
+      row.append(self.updated_at or '')
+    return row
+
+  @classmethod
+  def from_row(cls, row):
+    confidence = None
+    if len(row) > 3 and row[3].strip():
+      confidence = float(row[3])
+    updated_at = None
+    if len(row) > 4 and row[4].strip():
+      updated_at = row[4].strip()
+    return cls(row[0].strip(), row[1].strip(), row[2].strip(), confidence,
+               updated_at)
+
+
+def read_license_csv(license_csv_path):
+  """Yields a LicenseRecord for each row of a license CSV file."""
+  with open(license_csv_path, newline='') as license_csv:
+    for row in csv.reader(license_csv):
+      if not row:
+        continue
+      if not 3 <= len(row) <= 5:
+        raise ValueError(
+            f'{license_csv_path}: expected 3 to 5 columns, got {row}')
+      yield LicenseRecord.from_row(row)
 
 
 def load_license_csv(license_csv_path):
-  package_license_pairs = []
-  with open(license_csv_path) as license_csv:
-    package_license_lines = license_csv.readlines()
-    for line in package_license_lines:
-      package_license_pair = line.split(',')
-      assert len(package_license_pair) == 3
-      package_license_pair[0] = package_license_pair[0].strip()
-      package_license_pair[1] = package_license_pair[1].strip()
-      package_license_pair[2] = package_license_pair[2].strip()
-      package_license_pairs.append(package_license_pair)
-  return package_license_pairs
+  return list(read_license_csv(license_csv_path))
+
+
+def get_unknown_package_names(package_licenses, prefix=''):
+  """Returns the names of packages with prefix that have no license yet."""
+  return [
+      package_license.name
+      for package_license in package_licenses
+      if package_license.license == 'UNKNOWN' and
+      package_license.name.startswith(prefix)
+  ]
+
+
+def apply_package_licenses(package_licenses,
+                           licenses,
+                           source,
+                           confidences=None):
+  """Fills in licenses from a name to license mapping for UNKNOWN packages.
+
+  confidences optionally maps package names to the confidence of their
+  license. Returns the number of packages that were updated.
+  """
+  applied_count = 0
+  for package_license in package_licenses:
+    if package_license.license != 'UNKNOWN':
+      continue
+    if package_license.name in licenses:
+      package_license.license = licenses[package_license.name]
+      package_license.source = source
+      if confidences and package_license.name in confidences:
+        package_license.confidence = confidences[package_license.name]
+      applied_count += 1
+  return applied_count
+
+
+def lint_package_licenses(package_licenses, license_map):
+  """Resets licenses that aren't valid SPDX expressions to UNKNOWN.
+
+  Returns a list of (package name, invalid license) tuples.
+  """
+  license_validity = spdx.validate_many(
+      (package_license.license for package_license in package_licenses),
+      license_map)
+
+  invalid_licenses = []
+  for package_license in package_licenses:
+    if package_license.license == 'UNKNOWN':
+      continue
+    if not license_validity[package_license.license]:
+      invalid_licenses.append((package_license.name, package_license.license))
+      package_license.license = 'UNKNOWN'
+  return invalid_licenses
+
+
+def get_shard_size(item_count, jobs, max_shard_size=256):
+  """Returns how many items each task on a pool of jobs workers should get.
+
+  Items are split into about four shards per worker, so the workers finish
+  close together, and at most max_shard_size items per shard.
+  """
+  return max(1, min(max_shard_size, item_count // (jobs * 4)))
+
+
+@contextlib.contextmanager
+def atomic_write(output_path, mode='w', newline=None):
+  """Opens a temporary file that replaces output_path once it is closed.
+
+  mode is 'w' or 'wb'. If an exception is raised, output_path is left
+  untouched.
+  """
+  output_dir = os.path.dirname(os.path.abspath(output_path))
+  temp_fd, temp_path = tempfile.mkstemp(
+      dir=output_dir, prefix=f'.{os.path.basename(output_path)}.')
+  try:
+    with os.fdopen(temp_fd, mode, newline=newline) as output_file:
+      yield output_file
+      output_file.flush()
+      os.fsync(output_file.fileno())
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, output_path)
+  except BaseException:
+    os.unlink(temp_path)
+    raise
 
 
 def write_license_csv(license_csv_path, package_licenses):
-  with open(license_csv_path, 'w') as license_csv_file:
+  """Writes LicenseRecords to a license CSV file, atomically.
+
+  package_licenses can be any iterable, so records can be streamed through.
+  """
+  with atomic_write(license_csv_path, newline='') as license_csv_file:
+    license_csv_writer = csv.writer(license_csv_file, lineterminator='\n')
     for package_license in package_licenses:
-      pkg_name, pkg_license, source = package_license
-      license_csv_file.write(f'{pkg_name},{pkg_license},{source}\n')
+      license_csv_writer.writerow(package_license.to_row())
 
 
 def upgrade_deprecated_spdx_id(spdx_id):
@@ -54,46 +190,13 @@ def upgrade_deprecated_spdx_id(spdx_id):
 
 
 def get_license_list(license_file_path):
-  license_list = {}
-  with open(license_file_path) as license_list_file:
-    licenses_json = json.load(license_list_file)
-    for lic in licenses_json['licenses']:
-      license_list[lic['licenseId']] = True
-  return license_list
+  return catalog.load_catalog(license_file_path)
 
 
-def validate_exception(exception_string):
-  match (exception_string):
-    case 'OpenSSL-Exception':
-      return True
-    case 'LLVM-exception':
-      return True
-  return False
+def get_invalid_license_ids(spdx_expression, license_map):
+  """Returns the license and exception IDs in an expression that are invalid."""
+  return spdx.get_invalid_ids(spdx_expression, license_map)
 
 
 def validate_license(spdx_expression, license_map):
-  spdx_expression = spdx_expression.replace('(', '').replace(')', '')
-  removed_and_parts = [
-      removed_and.strip() for removed_and in spdx_expression.split('AND')
-  ]
-  removed_or_parts = []
-
-  for removed_and_part in removed_and_parts:
-    removed_or_parts.extend(
-        [removed_or.strip() for removed_or in removed_and_part.split('OR')])
-
-  for spdx_id in removed_or_parts:
-    if 'WITH' in spdx_id:
-      id_parts = spdx_id.split('WITH')
-      spdx_id = id_parts[0].strip()
-      exception = id_parts[1].strip()
-      if not validate_exception(exception):
-        return False
-    if spdx_id == 'custom':
-      continue
-    elif spdx_id == 'Public-Domain':
-      continue
-    if spdx_id not in license_map:
-      return False
-
-  return True
+  return spdx.validate(spdx_expression, license_map)
@@ -4,116 +4,120 @@ license detector.
 """
 
 import logging
-import subprocess
-import shutil
-import json
-import os
 
 from absl import flags
 from absl import app
 
-import ray
-
 from spack_license_utils import utils
+from spack_license_utils import executors
+from spack_license_utils import history
+from spack_license_utils import journal
+from spack_license_utils import stage
+from spack_license_utils import source_cache
 
 FLAGS = flags.FLAGS
 
 flags.DEFINE_string('input_file', None, 'The path to the input CSV file.')
 flags.DEFINE_string('output_file', None, 'The path to the output CSV file.')
+flags.DEFINE_string(
+    'source_cache_dir', None,
+    'The (optional) directory to cache detection results in, keyed by package '
+    'version and source checksum.')
+flags.DEFINE_integer('source_cache_max_bytes', source_cache.DEFAULT_MAX_BYTES,
+                     'The maximum total size of the source cache.')
+flags.DEFINE_enum(
+    'executor', executors.DEFAULT_EXECUTOR, executors.EXECUTORS,
+    'Where to run staging and detection: on a Ray cluster, or in a local '
+    'process or thread pool.')
+flags.DEFINE_integer('download_concurrency', stage.DEFAULT_DOWNLOAD_CONCURRENCY,
+                     'The number of packages to stage at once.')
+flags.DEFINE_integer(
+    'detect_workers', None,
+    'The number of license detectors to run at once. Defaults to the number '
+    'of CPUs available.')
+flags.DEFINE_integer(
+    'staged_queue_size', None,
+    'The number of staged packages that can wait for a detector before '
+    'staging pauses. Defaults to twice --detect_workers.')
+flags.DEFINE_string(
+    'journal_file', None,
+    'The (optional) path to a JSONL journal that each result is appended to '
+    'as soon as it is known. The output CSV is built from the journal.')
+flags.DEFINE_bool(
+    'resume', False,
+    'Skip the packages already in --journal_file instead of starting over.')
+flags.DEFINE_string(
+    'license_texts_dir', None,
+    'The (optional) path to a directory of SPDX license texts, like the text '
+    'directory of the SPDX license-list-data repository. Top level license '
+    'files are matched against it before running the license detector.')
+flags.DEFINE_integer(
+    'max_batch_size', stage.DEFAULT_MAX_BATCH_SIZE,
+    'The largest number of packages to run the license detector over at once. '
+    'Batches are kept small enough to finish well within the timeout.')
+flags.DEFINE_string(
+    'history_file', None,
+    'The (optional) path to a JSON file of per package timings. Packages '
+    'expected to take longest are started first, and the timings of each run '
+    'are added to it.')
 
 flags.mark_flag_as_required('input_file')
 flags.mark_flag_as_required('output_file')
 
 
-def get_detected_license_from_dir(repo_dir):
-  source_dir = os.path.join(repo_dir, 'spack-src')
-  detector_command_line = ['license-detector', '-f', 'json', source_dir]
-  try:
-    license_detector_process = subprocess.run(
-        detector_command_line, stdout=subprocess.PIPE, timeout=300)
-  except subprocess.TimeoutExpired:
-    logging.info('license-detector timeout expired')
-    return 'NOASSERTION'
-  if license_detector_process.returncode != 0:
-    logging.info('license-detector failed')
-    return 'NOASSERTION'
-  license_info = json.loads(license_detector_process.stdout.decode('utf-8'))
-  primary_project = license_info[0]
-  if 'error' in primary_project:
-    return 'NOASSERTION'
-  licenses_matched = primary_project['matches']
-  if licenses_matched[0]['confidence'] > 0.9:
-    return licenses_matched[0]['license']
-  return 'NOASSERTION'
-
-
-def get_license_from_package_name(package_name):
-  spack_stage_command = ['spack', 'stage', package_name]
-  spack_stage_process = subprocess.run(
-      spack_stage_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-  if spack_stage_process.returncode != 0:
-    return 'NOASSERTION'
-  stdout_lines = spack_stage_process.stdout.decode('utf-8').split('\n')
-  source_path = stdout_lines[-2].split(' ')[-1]
-  license_string = get_detected_license_from_dir(source_path)
-
-  shutil.rmtree(source_path)
-
-  return license_string
-
-
-@ray.remote(num_cpus=1)
-def get_package_license_future(package_name):
-  return (package_name, get_license_from_package_name(package_name))
+def get_journal_licenses(journal_path):
+  return {
+      package_name: utils.upgrade_deprecated_spdx_id(journal_license)
+      for package_name, journal_license in journal.read_journal(
+          journal_path).items()
+      if journal_license != 'NOASSERTION'
+  }
 
 
 def main(_):
-  ray.init()
+  if FLAGS.resume and not FLAGS.journal_file:
+    raise app.UsageError('--resume requires --journal_file.')
 
   package_licenses = utils.load_license_csv(FLAGS.input_file)
 
-  license_detection_futures = []
-
-  for package_license in package_licenses:
-    if package_license[1] != 'UNKNOWN':
-      continue
-    license_detection_futures.append(
-        get_package_license_future.remote(package_license[0]))
-
-  detected_license_map = {}
-
-  detected_licenses_count = 0
-  failed_detection = 0
+  cache = None
+  if FLAGS.source_cache_dir:
+    cache = source_cache.SourceCache(FLAGS.source_cache_dir,
+                                     FLAGS.source_cache_max_bytes)
+
+  package_names = utils.get_unknown_package_names(package_licenses)
+
+  stage_history = None
+  if FLAGS.history_file:
+    stage_history = history.StageHistory(FLAGS.history_file)
+
+  results_journal = None
+  if FLAGS.journal_file:
+    if FLAGS.resume:
+      journal_entries = journal.read_journal(FLAGS.journal_file)
+      package_names = [
+          package_name for package_name in package_names
+          if package_name not in journal_entries
+      ]
+      logging.info(f'Resuming with {len(journal_entries)} packages already in '
+                   'the journal.')
+    results_journal = journal.Journal(FLAGS.journal_file, FLAGS.resume)
 
-  while len(license_detection_futures) > 0:
-    finished, license_detection_futures = ray.wait(
-        license_detection_futures, timeout=5.0)
-    detected_licenses = ray.get(finished)
-
-    logging.info(
-        f'Just finished {len(finished)} packages, {len(license_detection_futures)} remaining.'
-    )
-
-    for detected_license in detected_licenses:
-      if detected_license[1] == 'NOASSERTION':
-        failed_detection += 1
-        continue
-      detected_license_map[detected_license[0]] = detected_license[1]
-      detected_licenses_count += 1
-
-  for package_license in package_licenses:
-    if package_license[0] in detected_license_map:
-      license_to_use = detected_license_map[package_license[0]]
-      package_license[1] = utils.upgrade_deprecated_spdx_id(license_to_use)
-      package_license[2] = 'Detected'
+  try:
+    detected_licenses = stage.get_package_licenses(
+        package_names, cache, FLAGS.executor, FLAGS.download_concurrency,
+        FLAGS.detect_workers, FLAGS.staged_queue_size, results_journal,
+        FLAGS.license_texts_dir, FLAGS.max_batch_size, stage_history)
+  finally:
+    if results_journal is not None:
+      results_journal.close()
+
+  if results_journal is not None:
+    detected_licenses = get_journal_licenses(FLAGS.journal_file)
+  utils.apply_package_licenses(package_licenses, detected_licenses, 'Detected')
 
   utils.write_license_csv(FLAGS.output_file, package_licenses)
 
-  logging.info(
-      f'Found license information for {detected_licenses_count} packages')
-  logging.info(
-      f'Failed to find license information for {failed_detection} packages')
-
 
 if __name__ == '__main__':
   app.run(main)
@@ -1,12 +1,14 @@
 """A tool for tagging spack packages with collected license information"""
 
+import concurrent.futures
 import logging
 import os
-import re
+import sys
 
 from absl import app
 from absl import flags
 
+from spack_license_utils import tagger
 from spack_license_utils import utils
 
 FLAGS = flags.FLAGS
@@ -16,85 +18,78 @@ flags.DEFINE_string(
     'The path to the spack checkout to update license information in')
 flags.DEFINE_string('input_path', None,
                     'The input path to the license information CSV to use.')
+flags.DEFINE_integer(
+    'jobs', None,
+    'The number of processes to tag packages with. Defaults to the number of '
+    'cores.')
+flags.DEFINE_bool(
+    'dry_run', False,
+    'Print a unified patch of the changes to stdout instead of modifying the '
+    'spack checkout.')
 
 flags.mark_flag_as_required('spack_checkout')
 flags.mark_flag_as_required('input_path')
 
 
-def main(_):
-  license_pairs = utils.load_license_csv(FLAGS.input_path)
-  for package_name, license, license_source in license_pairs:
-    if license_source == 'Spack':
-      continue
-    if license == 'UNKNOWN':
-      continue
-    print(package_name)
-    package_file_path = os.path.join(
-        FLAGS.spack_checkout,
-        f'./var/spack/repos/builtin/packages/{package_name}/package.py')
+def tag_package(spack_checkout, package_name, license, dry_run):
+  """Adds a license directive to a package.
+
+  Returns the package name, a status ('tagged', 'unchanged' or the reason
+  the package couldn't be tagged) and the patch if dry_run is set.
+  """
+  package_path = f'var/spack/repos/builtin/packages/{package_name}/package.py'
+  package_file_path = os.path.join(spack_checkout, package_path)
+  try:
     with open(package_file_path) as package_file:
-      package_file_lines = package_file.readlines()
-      line_index = 0
-      to_insert_index = 0
-      while line_index < len(package_file_lines):
-        if package_file_lines[line_index].strip().startswith('version('):
-          # Some of the version fields have (multiple) comments on them
-          while package_file_lines[line_index - 1].strip().startswith('#'):
-            line_index -= 1
-          # Some of the version fields are packed directly between variables.
-          # If that's the case, we need to create some space.
-          if re.match(r'^.* = ', package_file_lines[line_index - 1].strip()):
-            package_file_lines.insert(line_index, f'\n')
-            line_index += 1
-          # Some of the version fields are package directly under other
-          # directives, particularly the maintainers directive. Again, we need
-          # to create some space.
-          if package_file_lines[line_index -
-                                1].strip().startswith('maintainers('):
-            package_file_lines.insert(line_index - 1, '\n')
-          if package_file_lines[line_index - 1].strip().startswith('patch('):
-            package_file_lines.insert(line_index - 1, '\n')
-          # Some of the version fields are under multiple layers of control
-          # flow. If we detect this, just walk up to the top.
-          while package_file_lines[line_index].startswith('     '):
-            line_index -= 1
-          # Do another round of comment walking to handle the case where this a
-          # comment on top of the control flow.
-          while package_file_lines[line_index - 1].strip().startswith('#'):
-            line_index -= 1
-          assert (package_file_lines[line_index - 1].strip() == '')
-          to_insert_index = line_index - 1
-          break
-        line_index += 1
-
-    has_license = False
-
-    for file_line in package_file_lines:
-      if file_line.strip().startswith('license('):
-        has_license = True
-        break
-
-    if has_license:
-      continue
-
-    license_string = f'    license("{license}")\n'
-
-    comment_string = '    # License needs verification, see https://github.com/spack/spack/issues/41155'
-
-    if to_insert_index == len(package_file_lines):
-      package_file_lines.append('\n')
-      package_file_lines.append(license_string)
-      package_file_lines.append('\n')
-      package_file_lines.append(comment_string)
-    else:
-      package_file_lines.insert(to_insert_index + 1, comment_string)
-      package_file_lines.insert(to_insert_index + 2, '\n')
-      package_file_lines.insert(to_insert_index + 3, license_string)
-      package_file_lines.insert(to_insert_index + 4, '\n')
-
-    with open(package_file_path, 'w') as package_file:
-      for line in package_file_lines:
-        package_file.write(line)
+      package_source = package_file.read()
+    new_package_source = tagger.add_license(package_source, license,
+                                            package_name)
+  except (OSError, tagger.TaggingError) as error:
+    return package_name, str(error), None
+
+  if new_package_source == package_source:
+    return package_name, 'unchanged', None
+
+  if dry_run:
+    return package_name, 'tagged', tagger.get_patch(package_path,
+                                                    package_source,
+                                                    new_package_source)
+
+  with utils.atomic_write(package_file_path) as package_file:
+    package_file.write(new_package_source)
+  return package_name, 'tagged', None
+
+
+def main(_):
+  packages_to_tag = [
+      (license_record.name, license_record.license)
+      for license_record in utils.read_license_csv(FLAGS.input_path)
+      if license_record.source != 'Spack' and
+      license_record.license != 'UNKNOWN'
+  ]
+
+  tagged_count = 0
+  failed_count = 0
+  jobs = FLAGS.jobs or os.cpu_count()
+  with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+    tag_results = executor.map(
+        tag_package, [FLAGS.spack_checkout] * len(packages_to_tag),
+        [package_name for package_name, _ in packages_to_tag],
+        [license for _, license in packages_to_tag],
+        [FLAGS.dry_run] * len(packages_to_tag),
+        chunksize=utils.get_shard_size(len(packages_to_tag), jobs))
+    for package_name, status, patch in tag_results:
+      if status == 'tagged':
+        tagged_count += 1
+        logging.info(f'Tagged {package_name}')
+        if patch:
+          sys.stdout.write(patch)
+      elif status != 'unchanged':
+        failed_count += 1
+        logging.warning(f'Could not tag {package_name}: {status}')
+
+  logging.info(f'Tagged {tagged_count} of {len(packages_to_tag)} packages, '
+               f'{failed_count} could not be tagged.')
 
 
 if __name__ == '__main__':
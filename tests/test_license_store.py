@@ -0,0 +1,46 @@
+"""Tests for the SQLite license store."""
+
+from spack_license_utils import license_store
+
+
+def _get_rows(store):
+  return {
+      record.name: (record.license, record.source)
+      for record in store.get_records()
+  }
+
+
+def test_writes_stamp_updated_at(tmp_path):
+  with license_store.LicenseStore(str(tmp_path / 'licenses.db')) as store:
+    (tmp_path / 'packages.csv').write_text('foo,UNKNOWN,NONE\n'
+                                           'bar,MIT,Spack,,2000-01-01\n')
+    store.import_csv(str(tmp_path / 'packages.csv'))
+    store.apply_licenses({'foo': 'Apache-2.0'}, 'Alpine')
+    updated_at = {
+        record.name: record.updated_at for record in store.get_records()
+    }
+  assert updated_at['bar'] == '2000-01-01'
+  assert updated_at['foo'] > '2000-01-01'
+  assert updated_at['foo'].endswith('+00:00')
+
+
+def test_reimport_keeps_licenses_from_other_sources(tmp_path):
+  packages_csv = tmp_path / 'packages.csv'
+  packages_csv.write_text('foo,UNKNOWN,NONE\n'
+                          'bar,UNKNOWN,NONE\n'
+                          'baz,MIT,Spack\n')
+  with license_store.LicenseStore(str(tmp_path / 'licenses.db')) as store:
+    store.import_csv(str(packages_csv))
+    store.apply_licenses({'foo': 'Apache-2.0', 'bar': 'BSD-3-Clause'}, 'Alpine')
+
+    packages_csv.write_text('foo,UNKNOWN,NONE\n'
+                            'bar,GPL-2.0-only,Spack\n'
+                            'baz,UNKNOWN,NONE\n'
+                            'qux,UNKNOWN,NONE\n')
+    assert store.import_csv(str(packages_csv)) == 3
+    assert _get_rows(store) == {
+        'foo': ('Apache-2.0', 'Alpine'),
+        'bar': ('GPL-2.0-only', 'Spack'),
+        'baz': ('UNKNOWN', 'NONE'),
+        'qux': ('UNKNOWN', 'NONE'),
+    }
@@ -0,0 +1,94 @@
+"""Tests for reading license() directives from package.py files."""
+
+import ast
+
+import pytest
+
+from spack_license_utils import package_ast
+
+_PACKAGE_CLASS = '''
+class Libxml2(AutotoolsPackage, CMakePackage):
+    license("MIT")
+
+    version("2.13.4", sha256="0")
+'''
+
+_BUILDER_CLASS = '''
+class CMakeBuilder(spack.build_systems.cmake.CMakeBuilder):
+    def cmake_args(self):
+        return []
+'''
+
+
+@pytest.mark.parametrize('package_source', [
+    'from spack.package import *\n' + _PACKAGE_CLASS + _BUILDER_CLASS,
+    'from spack.package import *\n' + _BUILDER_CLASS + _PACKAGE_CLASS,
+])
+@pytest.mark.parametrize('package_name', ['libxml2', None])
+def test_builder_class_is_skipped(package_source, package_name):
+  assert package_ast.get_licenses(
+      package_source, package_name=package_name) == [('MIT', None)]
+
+
+def test_package_class_is_found_through_local_base_class():
+  package_source = '''
+from spack.package import *
+
+class FooBase(Package):
+    pass
+
+class Foo(FooBase):
+    license("MIT")
+
+class FooBuilder(spack.build_systems.generic.GenericBuilder):
+    pass
+'''
+  assert package_ast.get_licenses(package_source) == [('MIT', None)]
+
+
+def test_ambiguous_package_class_is_unresolved():
+  package_source = '''
+from spack.package import *
+
+class Foo(Package):
+    license("MIT")
+
+class Bar(Package):
+    license("BSD-3-Clause")
+'''
+  with pytest.raises(package_ast.UnresolvedLicenseError):
+    package_ast.get_licenses(package_source)
+  assert package_ast.get_licenses(
+      package_source, package_name='bar') == [('BSD-3-Clause', None)]
+
+
+def test_get_package_class_without_classes():
+  with pytest.raises(package_ast.UnresolvedLicenseError):
+    package_ast.get_package_class(ast.parse('import os\n'))
+
+
+@pytest.mark.parametrize('package_name, class_name', [
+    ('libxml2', 'Libxml2'),
+    ('py-numpy', 'PyNumpy'),
+    ('7zip', '_7zip'),
+    ('r-data-table', 'RDataTable'),
+])
+def test_get_class_name(package_name, class_name):
+  assert package_ast.get_class_name(package_name) == class_name
+
+
+def test_get_package_file_licenses_uses_directory_name(tmp_path):
+  package_dir = tmp_path / 'libxml2'
+  package_dir.mkdir()
+  package_file = package_dir / 'package.py'
+  package_file.write_text('''
+from spack.package import *
+
+class Libxml2(spack.pkg.builtin.libxml2_base.Libxml2Base):
+    license("MIT")
+
+class Libxml2Base(Package):
+    pass
+''')
+  assert package_ast.get_package_file_licenses(str(package_file)) == [('MIT',
+                                                                       None)]
@@ -0,0 +1,62 @@
+"""Tests for fetching package information from PyPI."""
+
+import json
+import random
+
+import pytest
+
+from spack_license_utils import pypi
+from spack_license_utils import synthetic
+
+_PACKAGE_NAMES = ['numpy', 'Django', 'zope.interface', 'typing_extensions']
+
+
+def _get_json_index(package_names):
+  return json.dumps(
+      {
+          'meta': {
+              '_last-serial': 123456,
+              'api-version': '1.1'
+          },
+          'projects': [{
+              '_last-serial': 1000 + index,
+              'name': package_name
+          } for index, package_name in enumerate(package_names)],
+      },
+      indent=1)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1024 * 1024])
+def test_json_index_parser_handles_any_chunking(chunk_size):
+  index_body = _get_json_index(_PACKAGE_NAMES)
+  index_parser = pypi._SimpleJsonIndexParser()
+  for offset in range(0, len(index_body), chunk_size):
+    index_parser.feed(index_body[offset:offset + chunk_size])
+  index_parser.close()
+  assert index_parser.package_names == _PACKAGE_NAMES
+
+
+def test_json_index_parser_projects_before_meta():
+  index_parser = pypi._SimpleJsonIndexParser()
+  index_parser.feed('{"projects": [{"name": "foo"}, {"name": "bar"}], '
+                    '"meta": {"api-version": "1.0"}}')
+  index_parser.close()
+  assert index_parser.package_names == ['foo', 'bar']
+
+
+def test_json_index_parser_rejects_truncated_index():
+  index_parser = pypi._SimpleJsonIndexParser()
+  index_parser.feed(_get_json_index(_PACKAGE_NAMES)[:-20])
+  with pytest.raises(ValueError):
+    index_parser.close()
+
+
+def test_fetch_package_name_index_from_json():
+  package_names = [f'package-{index}' for index in range(5000)]
+  with synthetic.PyPIServer(random.Random(0), package_names) as pypi_server:
+    package_name_index = pypi.fetch_package_name_index(pypi.create_session(),
+                                                       pypi_server.url)
+  assert len(package_name_index) == len(package_names)
+  assert 'package-42' in package_name_index
+  assert 'Package_42' in package_name_index
+  assert 'package-5000' not in package_name_index
@@ -0,0 +1,51 @@
+"""Tests for planning where license() directives go in package.py files."""
+
+import pytest
+
+from spack_license_utils import tagger
+
+_PACKAGE_CLASS = '''
+class Libxml2(AutotoolsPackage, CMakePackage):
+    homepage = "https://gitlab.gnome.org/GNOME/libxml2"
+
+    version("2.13.4", sha256="0")
+'''
+
+_BUILDER_CLASS = '''
+class CMakeBuilder(spack.build_systems.cmake.CMakeBuilder):
+    def cmake_args(self):
+        return []
+'''
+
+
+@pytest.mark.parametrize('package_source', [
+    'from spack.package import *\n' + _PACKAGE_CLASS + _BUILDER_CLASS,
+    'from spack.package import *\n' + _BUILDER_CLASS + _PACKAGE_CLASS,
+])
+@pytest.mark.parametrize('package_name', ['libxml2', None])
+def test_builder_class_is_skipped(package_source, package_name):
+  tagged_source = tagger.add_license(package_source, 'MIT', package_name)
+  class_source = tagged_source[tagged_source.index('class Libxml2'):]
+  assert class_source.index('license("MIT")') < class_source.index(
+      'version("2.13.4"')
+  assert tagged_source.count('license(') == 1
+
+
+def test_already_licensed_package_is_unchanged():
+  package_source = ('from spack.package import *\n' +
+                    _BUILDER_CLASS + _PACKAGE_CLASS.replace(
+                        '    version(', '    license("MIT")\n    version('))
+  assert tagger.add_license(package_source, 'BSD-3-Clause',
+                            'libxml2') == package_source
+
+
+def test_ambiguous_package_class_is_not_tagged():
+  package_source = '''
+class Foo(Package):
+    version("1.0", sha256="0")
+
+class Bar(Package):
+    version("1.0", sha256="0")
+'''
+  with pytest.raises(tagger.TaggingError):
+    tagger.add_license(package_source, 'MIT')
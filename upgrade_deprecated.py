@@ -20,12 +20,14 @@ flags.mark_flag_as_required('output_file')
 
 
 def main(_):
-  package_licenses = utils.load_license_csv(FLAGS.input_file)
 
-  for package_license in package_licenses:
-    package_license[1] = utils.upgrade_deprecated_spdx_id(package_license[1])
+  def upgrade_package_licenses():
+    for package_license in utils.read_license_csv(FLAGS.input_file):
+      package_license.license = utils.upgrade_deprecated_spdx_id(
+          package_license.license)
+      yield package_license
 
-  utils.write_license_csv(FLAGS.output_file, package_licenses)
+  utils.write_license_csv(FLAGS.output_file, upgrade_package_licenses())
 
 
 if __name__ == '__main__':